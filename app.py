@@ -1,15 +1,29 @@
+import matplotlib
+matplotlib.use('Agg')
 import streamlit as st
 import pandas as pd
+import numpy as np
+import hashlib
 import os
-import tempfile
+import io
+import cProfile
+import pstats
+from typing import Optional
+
+# Process-wide pandas setting, enabled before the project modules are imported so
+# they all run under it: copies made by assign/filters stay lazy until written
+pd.set_option('mode.copy_on_write', True)
+
 from pdf_processor import PDFProcessor
 from data_analyzer import DataAnalyzer
 from visualization import VisualizationGenerator
-from utils import format_summary_table, format_detailed_table
+from utils import format_summary_table, format_detailed_table, parse_exam_dates
 from synthetic_data_generator import SyntheticDataGenerator
 from lesion_grouper import LesionGrouper
-from treatment_manager import TreatmentManager
-import io
+from treatment_manager import TreatmentManager, active_treatment_periods
+
+# Developer-only chart profiling toggle, shown when this variable is set
+PROFILE_CHARTS = bool(os.environ.get('ONCOSIZE_PROFILE_CHARTS'))
 
 def main():
     st.set_page_config(
@@ -29,6 +43,8 @@ def main():
         st.session_state.analysis_results = None
     if 'charts_generated' not in st.session_state:
         st.session_state.charts_generated = False
+    if 'available_lesions' not in st.session_state:
+        st.session_state.available_lesions = ()
     
     # Sidebar for file upload
     with st.sidebar:
@@ -67,8 +83,13 @@ def main():
             if st.button("🗑️ Limpar Dados Atuais", type="secondary"):
                 st.session_state.processed_data = None
                 st.session_state.analysis_results = None
+                st.session_state.available_lesions = ()
                 st.session_state.charts_generated = False
                 st.rerun()
+        
+        if PROFILE_CHARTS:
+            st.divider()
+            st.checkbox("⏱️ Perfilar gráficos (dev)", key='profile_charts')
     
     # Main content area
     if st.session_state.processed_data is not None and st.session_state.analysis_results is not None:
@@ -76,6 +97,32 @@ def main():
     else:
         display_instructions()
 
+# Columns collected for every lesion measurement
+LESION_COLUMNS = ('lesao_id', 'data_exame', 'tamanho_cm', 'tratamentos', 'source_file')
+
+def _new_lesion_columns(*extra_columns) -> dict:
+    """Create empty per-column buffers for lesion measurements"""
+    return {column: [] for column in LESION_COLUMNS + extra_columns}
+
+def _append_lesion_rows(columns: dict, rows: list, source_file: str = None):
+    """Append lesion measurement dicts to the per-column buffers"""
+    for row in rows:
+        for column, values in columns.items():
+            values.append(row.get(column))
+        if source_file is not None:
+            columns['source_file'][-1] = source_file
+
+def _lesion_columns_to_dataframe(columns: dict) -> pd.DataFrame:
+    """Build the lesion DataFrame from the per-column buffers"""
+    data = dict(columns)
+    data['tamanho_cm'] = np.asarray(columns['tamanho_cm'], dtype=np.float32)
+    # Lesion and file names repeat across exams: store them as categories
+    data['lesao_id'] = pd.Categorical(columns['lesao_id'])
+    data['source_file'] = pd.Categorical(columns['source_file'])
+    # Parse exam dates once here; unparseable dates become NaT
+    data['data_exame'] = parse_exam_dates(columns['data_exame']).to_numpy()
+    return pd.DataFrame(data)
+
 def process_files(uploaded_files):
     """Process uploaded PDF files and analyze lesion data"""
     progress_bar = st.progress(0)
@@ -86,39 +133,43 @@ def process_files(uploaded_files):
         pdf_processor = PDFProcessor()
         data_analyzer = DataAnalyzer()
         
-        # Process each PDF file
-        all_data = []
-        for i, uploaded_file in enumerate(uploaded_files):
-            status_text.text(f"Processando arquivo {i+1}/{len(uploaded_files)}: {uploaded_file.name}")
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                tmp_file_path = tmp_file.name
+        # Parse uploads from memory, then run the OpenAI calls concurrently
+        lesion_columns = _new_lesion_columns('confianca')
+        status_text.text(f"Extraindo dados de {len(uploaded_files)} arquivo(s) com IA...")
+        completed = 0
+        
+        # Each file is reported as soon as its OpenAI call finishes
+        def report_file(i, file_data, error):
+            nonlocal completed
+            completed += 1
+            uploaded_file = uploaded_files[i]
+            status_text.text(f"Processado arquivo {completed}/{len(uploaded_files)}: {uploaded_file.name}")
             
-            try:
-                # Extract data from PDF
-                file_data = pdf_processor.extract_lesion_data(tmp_file_path)
-                if file_data:
-                    # Add source file info
-                    for data_point in file_data:
-                        data_point['source_file'] = uploaded_file.name
-                    
-                    all_data.extend(file_data)
-                    st.success(f"✅ {uploaded_file.name}: {len(file_data)} medições extraídas com IA")
-                else:
-                    st.warning(f"⚠️ {uploaded_file.name}: Nenhuma medição encontrada")
-            except Exception as e:
-                st.error(f"❌ Erro ao processar {uploaded_file.name}: {str(e)}")
-            finally:
-                # Clean up temporary file
-                os.unlink(tmp_file_path)
+            if error is not None:
+                st.error(f"❌ Erro ao processar {uploaded_file.name}: {error}")
+            elif file_data:
+                st.success(f"✅ {uploaded_file.name}: {len(file_data)} medições extraídas com IA")
+                # Add source file info
+                _append_lesion_rows(lesion_columns, file_data, uploaded_file.name)
+            else:
+                st.warning(f"⚠️ {uploaded_file.name}: Nenhuma medição encontrada")
             
-            progress_bar.progress((i + 1) / len(uploaded_files))
+            progress_bar.progress(completed / len(uploaded_files))
         
-        if all_data:
+        pdf_processor.extract_lesion_data_batch(
+            [(uploaded_file.getvalue(), uploaded_file.name) for uploaded_file in uploaded_files],
+            on_result=report_file
+        )
+        
+        if lesion_columns['lesao_id']:
             # Convert to DataFrame
-            df = pd.DataFrame(all_data)
+            df = _lesion_columns_to_dataframe(lesion_columns)
+            
+            # A report with an unreadable date loses only those measurements
+            invalid_dates = df['data_exame'].isna()
+            if invalid_dates.any():
+                st.warning(f"⚠️ {int(invalid_dates.sum())} medição(ões) com data de exame inválida foram ignoradas")
+                df = df[~invalid_dates]
             
             # Group similar lesions
             status_text.text("Agrupando lesões similares...")
@@ -132,6 +183,7 @@ def process_files(uploaded_files):
             # Store results in session state
             st.session_state.processed_data = df_grouped
             st.session_state.analysis_results = analysis_results
+            st.session_state.available_lesions = tuple(analysis_results['summary_table']['Lesão'].unique())
             st.session_state.charts_generated = False
             
             status_text.text("✅ Processamento concluído!")
@@ -155,7 +207,9 @@ def generate_demo_data():
         demo_data = synthetic_generator.generate_demo_button_data()
         
         # Convert to DataFrame and group lesions
-        df = pd.DataFrame(demo_data)
+        lesion_columns = _new_lesion_columns()
+        _append_lesion_rows(lesion_columns, demo_data)
+        df = _lesion_columns_to_dataframe(lesion_columns)
         lesion_grouper = LesionGrouper()
         df_grouped = lesion_grouper.group_similar_lesions(df)
         
@@ -166,6 +220,7 @@ def generate_demo_data():
         # Store in session state
         st.session_state.processed_data = df_grouped
         st.session_state.analysis_results = analysis_results
+        st.session_state.available_lesions = tuple(analysis_results['summary_table']['Lesão'].unique())
         st.session_state.charts_generated = False
         
         st.success("✅ Dados de demonstração carregados!")
@@ -181,7 +236,9 @@ def generate_full_demo_data():
         full_data = synthetic_generator.generate_patient_data(num_exams=8, num_lesions=6)
         
         # Convert to DataFrame and group lesions
-        df = pd.DataFrame(full_data)
+        lesion_columns = _new_lesion_columns()
+        _append_lesion_rows(lesion_columns, full_data)
+        df = _lesion_columns_to_dataframe(lesion_columns)
         lesion_grouper = LesionGrouper()
         df_grouped = lesion_grouper.group_similar_lesions(df)
         
@@ -192,6 +249,7 @@ def generate_full_demo_data():
         # Store in session state
         st.session_state.processed_data = df_grouped
         st.session_state.analysis_results = analysis_results
+        st.session_state.available_lesions = tuple(analysis_results['summary_table']['Lesão'].unique())
         st.session_state.charts_generated = False
         
         st.success("✅ Dataset completo carregado!")
@@ -208,7 +266,7 @@ def display_treatment_management(df):
     treatment_manager.display_treatment_input_interface()
     
     # If there are treatments, correlate with lesion data
-    if st.session_state.get('treatment_periods'):
+    if active_treatment_periods():
         st.subheader("🔗 Correlação com Evolução das Lesões")
         
         # Get data with treatment correlations
@@ -274,14 +332,52 @@ def display_results():
     with tab5:
         display_download_options(df, analysis_results)
 
+def _treatment_cache_key() -> tuple:
+    """Hashable snapshot of the treatment periods drawn on the charts"""
+    return tuple(
+        tuple(sorted(treatment.items()))
+        for treatment in st.session_state.get('treatment_periods', [])
+    )
+
+def _chart_data_hash(df: pd.DataFrame) -> bytes:
+    """Content digest of the columns the charts are drawn from"""
+    return _content_hash(df[['lesao_id', 'data_exame', 'tamanho_cm']])
+
+# Charts are cached as encoded PNG bytes rather than live Figures; st.image serves
+# them as-is, without the re-render st.pyplot does on every rerun
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=64)
+def _cached_combined_chart(data_hash: bytes, _detailed_data: pd.DataFrame, selected_lesions: tuple, treatment_key: tuple) -> bytes:
+    """Render the combined chart once per (data, selection, treatments)"""
+    treatments = [dict(items) for items in treatment_key]
+    return VisualizationGenerator().create_combined_chart_png(_detailed_data, list(selected_lesions), treatments)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=64)
+def _cached_individual_chart(data_hash: bytes, _lesion_data: pd.DataFrame, lesion_name: str, treatment_key: tuple) -> bytes:
+    """Render an individual lesion chart once per (data, treatments)"""
+    treatments = [dict(items) for items in treatment_key]
+    return VisualizationGenerator().create_individual_chart_png(_lesion_data, lesion_name, treatments)
+
+def _profile_combined_chart(detailed_data: pd.DataFrame, selected_lesions: list):
+    """Profile an uncached render of the combined chart and show the top functions"""
+    with cProfile.Profile() as profiler:
+        VisualizationGenerator().create_combined_chart_png(
+            detailed_data, list(selected_lesions), active_treatment_periods()
+        )
+    
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('tottime').print_stats(25)
+    with st.expander("⏱️ Perfil do gráfico combinado"):
+        st.code(stream.getvalue())
+
+# The lesion filter and the combined-chart toggle only rerun this section,
+# not the whole app
+@st.fragment
 def display_visualizations(analysis_results):
     """Display charts and visualizations"""
-    viz_generator = VisualizationGenerator()
-    
     st.subheader("📈 Evolução das Lesões")
     
     # Filter options
-    available_lesions = list(analysis_results['summary_table']['Lesão'].unique())
+    available_lesions = list(st.session_state.available_lesions)
     
     col1, col2 = st.columns(2)
     with col1:
@@ -297,24 +393,51 @@ def display_visualizations(analysis_results):
         # Generate and display charts
         if show_combined:
             st.subheader("Comparação de Todas as Lesões")
-            fig_combined = viz_generator.create_combined_chart(
+            png_combined = _cached_combined_chart(
+                _chart_data_hash(analysis_results['detailed_data']),
                 analysis_results['detailed_data'], 
-                selected_lesions
+                tuple(selected_lesions),
+                _treatment_cache_key()
             )
-            st.pyplot(fig_combined)
+            st.image(png_combined, use_container_width=True)
+            
+            if PROFILE_CHARTS and st.session_state.get('profile_charts'):
+                _profile_combined_chart(analysis_results['detailed_data'], selected_lesions)
         
         # Individual charts
         st.subheader("Gráficos Individuais")
+        lesion_groups = dict(list(analysis_results['detailed_data'].groupby('lesao_id', sort=False)))
         for lesion in selected_lesions:
-            lesion_data = analysis_results['detailed_data'][
-                analysis_results['detailed_data']['lesao_id'] == lesion
-            ]
-            if not lesion_data.empty:
-                fig_individual = viz_generator.create_individual_chart(lesion_data, lesion)
-                st.pyplot(fig_individual)
+            lesion_data = lesion_groups.get(lesion)
+            if lesion_data is not None and not lesion_data.empty:
+                png_individual = _cached_individual_chart(
+                    _chart_data_hash(lesion_data), lesion_data, lesion, _treatment_cache_key()
+                )
+                st.image(png_individual, use_container_width=True)
     else:
         st.warning("Selecione pelo menos uma lesão para visualizar")
 
+def _content_hash(df: pd.DataFrame) -> bytes:
+    """Content digest of a DataFrame, used as a cheap cache key"""
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    except TypeError:
+        # List-valued columns (tratamentos) are hashed by their string form
+        objects = df.select_dtypes(include='object').columns
+        row_hashes = pd.util.hash_pandas_object(
+            df.assign(**{column: df[column].astype(str) for column in objects}), index=True
+        ).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).digest()
+
+@st.cache_data(show_spinner=False)
+def _format_summary_df(summary_hash: bytes, _summary_df: pd.DataFrame) -> pd.DataFrame:
+    """Format the summary dataframe for display; cached on its content hash"""
+    formatted_df = _summary_df.copy()
+    formatted_df['Tamanho Inicial (cm)'] = np.char.mod('%.2f', formatted_df['Tamanho Inicial (cm)'].to_numpy(dtype=float))
+    formatted_df['Tamanho Final (cm)'] = np.char.mod('%.2f', formatted_df['Tamanho Final (cm)'].to_numpy(dtype=float))
+    formatted_df['Variação Total (%)'] = np.char.mod('%+.1f%%', formatted_df['Variação Total (%)'].to_numpy(dtype=float))
+    return formatted_df
+
 def display_summary_table(analysis_results):
     """Display summary table"""
     st.subheader("📋 Tabela Resumida")
@@ -322,10 +445,7 @@ def display_summary_table(analysis_results):
     summary_df = analysis_results['summary_table']
     
     # Format the dataframe for better display
-    formatted_df = summary_df.copy()
-    formatted_df['Tamanho Inicial (cm)'] = formatted_df['Tamanho Inicial (cm)'].apply(lambda x: f"{x:.2f}")
-    formatted_df['Tamanho Final (cm)'] = formatted_df['Tamanho Final (cm)'].apply(lambda x: f"{x:.2f}")
-    formatted_df['Variação Total (%)'] = formatted_df['Variação Total (%)'].apply(lambda x: f"{x:+.1f}%")
+    formatted_df = _format_summary_df(_content_hash(summary_df), summary_df)
     
     st.dataframe(formatted_df, use_container_width=True)
     
@@ -334,24 +454,30 @@ def display_summary_table(analysis_results):
         markdown_table = format_summary_table(summary_df)
         st.text_area("Tabela em formato Markdown", markdown_table, height=300)
 
-def display_detailed_data(df):
-    """Display detailed measurement data"""
-    st.subheader("📅 Dados Detalhados por Data")
-    
+@st.cache_data(show_spinner=False)
+def _format_detailed_df(data_hash: bytes, _df: pd.DataFrame) -> pd.DataFrame:
+    """Format the detailed measurements for display; cached on their content hash"""
     # Sort by date and lesion
-    sorted_df = df.sort_values(['data_exame', 'lesao_id'])
+    sorted_df = _df.sort_values(['data_exame', 'lesao_id'])
     
-    # Format for display
-    display_df = sorted_df.copy()
-    display_df['tamanho_cm'] = display_df['tamanho_cm'].apply(lambda x: f"{x:.2f}")
-    display_df['data_exame'] = pd.to_datetime(display_df['data_exame']).dt.strftime('%d/%m/%Y')
+    # Format for display (data_exame is parsed once at ingest);
+    # sort_values already returned a new frame
+    display_df = sorted_df
+    display_df['tamanho_cm'] = np.char.mod('%.2f', display_df['tamanho_cm'].to_numpy(dtype=float))
+    display_df['data_exame'] = display_df['data_exame'].dt.strftime('%d/%m/%Y')
     
     # Rename columns for Portuguese
-    display_df = display_df.rename(columns={
+    return display_df.rename(columns={
         'lesao_id': 'Lesão',
         'data_exame': 'Data do Exame',
         'tamanho_cm': 'Tamanho (cm)'
     })
+
+def display_detailed_data(df):
+    """Display detailed measurement data"""
+    st.subheader("📅 Dados Detalhados por Data")
+    
+    display_df = _format_detailed_df(_content_hash(df), df)
     
     st.dataframe(display_df, use_container_width=True)
 
@@ -388,25 +514,35 @@ def display_download_options(df, analysis_results):
         if st.button("🖼️ Gerar Gráficos PNG"):
             generate_chart_downloads(analysis_results)
 
+@st.cache_data(show_spinner=False)
+def _png_bytes(data_hash: bytes, _detailed_data: pd.DataFrame, lesions: tuple, treatment_key: tuple,
+               dpi: Optional[int] = None) -> bytes:
+    """Render the combined chart to PNG bytes once per (data, lesions, treatments, dpi)
+    
+    ``dpi`` defaults to the generator's ``export_dpi``.
+    """
+    # Charts are plain Agg figures outside pyplot's registry, so nothing needs closing
+    generator = VisualizationGenerator()
+    treatments = [dict(items) for items in treatment_key]
+    fig = generator.create_combined_chart(_detailed_data, list(lesions), treatments)
+    return generator.to_png_bytes(fig, dpi or generator.export_dpi)
+
 def generate_chart_downloads(analysis_results):
     """Generate and offer chart downloads"""
-    viz_generator = VisualizationGenerator()
-    
     try:
         # Generate combined chart
-        fig_combined = viz_generator.create_combined_chart(
-            analysis_results['detailed_data'], 
-            list(analysis_results['summary_table']['Lesão'].unique())
+        png_data = _png_bytes(
+            _chart_data_hash(analysis_results['detailed_data']),
+            analysis_results['detailed_data'],
+            st.session_state.available_lesions,
+            _treatment_cache_key(),
+            # The downloadable chart stays print-ready
+            dpi=300
         )
         
-        # Save to bytes buffer
-        img_buffer = io.BytesIO()
-        fig_combined.savefig(img_buffer, format='PNG', dpi=300, bbox_inches='tight')
-        img_buffer.seek(0)
-        
         st.download_button(
             label="📈 Baixar Gráfico Combinado (PNG)",
-            data=img_buffer.getvalue(),
+            data=png_data,
             file_name="grafico_todas_lesoes.png",
             mime="image/png"
         )
@@ -418,19 +554,24 @@ def generate_chart_downloads(analysis_results):
 
 def generate_summary_text(analysis_results):
     """Generate executive summary text"""
-    summary_df = analysis_results['summary_table']
-    
+    return _summary_text(analysis_results['summary_table'])
+
+@st.cache_data(show_spinner=False)
+def _summary_text(summary_df: pd.DataFrame) -> str:
+    """Build the executive summary text from the summary table"""
     if summary_df.empty:
         return "Nenhuma lesão foi encontrada nos laudos processados."
     
-    total_lesions = len(summary_df)
-    increased_lesions = len(summary_df[summary_df['Variação Total (%)'] > 10])
-    decreased_lesions = len(summary_df[summary_df['Variação Total (%)'] < -10])
-    stable_lesions = len(summary_df[abs(summary_df['Variação Total (%)']) <= 10])
+    # Derive all statistics from a single pass over the variation column
+    variations = summary_df['Variação Total (%)'].to_numpy(dtype=float)
+    total_lesions = len(variations)
+    increased_lesions = int((variations > 10).sum())
+    decreased_lesions = int((variations < -10).sum())
+    stable_lesions = int((np.abs(variations) <= 10).sum())
     
     # Find most significant changes
-    max_increase = summary_df.loc[summary_df['Variação Total (%)'].idxmax()] if not summary_df.empty else None
-    max_decrease = summary_df.loc[summary_df['Variação Total (%)'].idxmin()] if not summary_df.empty else None
+    max_increase = summary_df.iloc[np.nanargmax(variations)]
+    max_decrease = summary_df.iloc[np.nanargmin(variations)]
     
     summary_parts = [
         f"**Análise de {total_lesions} lesão(ões) encontrada(s):**",
@@ -439,10 +580,10 @@ def generate_summary_text(analysis_results):
         f"• {stable_lesions} lesão(ões) estável(eis) (±10%)"
     ]
     
-    if max_increase is not None and max_increase['Variação Total (%)'] > 0:
+    if max_increase['Variação Total (%)'] > 0:
         summary_parts.append(f"• **Maior crescimento:** {max_increase['Lesão']} (+{max_increase['Variação Total (%)']:.1f}%)")
     
-    if max_decrease is not None and max_decrease['Variação Total (%)'] < 0:
+    if max_decrease['Variação Total (%)'] < 0:
         summary_parts.append(f"• **Maior redução:** {max_decrease['Lesão']} ({max_decrease['Variação Total (%)']:.1f}%)")
     
     return "\n".join(summary_parts)
@@ -3,7 +3,7 @@ import tempfile
 from typing import List, Dict, Optional
 import streamlit as st
 from openai import OpenAI
-import json
+import orjson
 
 class AudioProcessor:
     """Handles audio transcription and medical data extraction using OpenAI"""
@@ -73,14 +73,84 @@ class AudioProcessor:
                 temperature=0.1
             )
             
-            result = json.loads(response.choices[0].message.content)
+            result = orjson.loads(response.choices[0].message.content)
             return result
             
         except Exception as e:
             raise Exception(f"Erro ao extrair dados médicos: {str(e)}")
     
-    def process_audio_file(self, audio_file_path: str) -> List[Dict]:
-        """Complete pipeline: transcribe audio and extract medical data"""
+    def extract_medical_data_batch(self, transcripts: List[str], batch_size: int = 10) -> List[Dict]:
+        """Extract medical data from several transcripts with one request per batch"""
+        results = []
+        
+        for start in range(0, len(transcripts), batch_size):
+            batch = transcripts[start:start + batch_size]
+            results.extend(self._extract_medical_data_single_batch(batch))
+        
+        return results
+    
+    def _extract_medical_data_single_batch(self, transcripts: List[str]) -> List[Dict]:
+        """Send a batch of transcripts in a single chat completion"""
+        try:
+            system_prompt = """
+            Você é um especialista em análise de laudos médicos oncológicos. 
+            Você receberá uma lista JSON de textos transcritos de laudos médicos, cada um com um "id".
+            Para CADA texto, extraia as seguintes informações:
+            
+            1. Data do exame (formato: YYYY-MM-DD)
+            2. Lista de lesões com seus identificadores e medidas em centímetros
+            3. Tratamentos mencionados
+            
+            Responda em formato JSON com a seguinte estrutura:
+            {
+                "resultados": [
+                    {
+                        "id": id do texto correspondente,
+                        "data_exame": "YYYY-MM-DD",
+                        "lesoes": [
+                            {
+                                "identificador": "nome da lesão",
+                                "tamanho_cm": número em centímetros
+                            }
+                        ],
+                        "tratamentos": ["lista de tratamentos mencionados"],
+                        "observacoes": "observações importantes"
+                    }
+                ]
+            }
+            
+            Se alguma informação não estiver disponível, use null.
+            Converta todas as medidas para centímetros (mm → cm).
+            """
+            
+            user_prompt = orjson.dumps(
+                [{"id": i, "text": transcript} for i, transcript in enumerate(transcripts)]
+            ).decode()
+            
+            response = self.openai_client.chat.completions.create(
+                model="gpt-4.1",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.1
+            )
+            
+            result = orjson.loads(response.choices[0].message.content)
+            
+            # Match results back to inputs by id; missing entries become empty dicts
+            by_id = {item.get('id'): item for item in result.get('resultados', [])}
+            return [by_id.get(i, {}) for i in range(len(transcripts))]
+            
+        except Exception as e:
+            raise Exception(f"Erro ao extrair dados médicos: {str(e)}")
+    
+    def process_audio_file(self, audio_file_path: str) -> Dict[str, List]:
+        """Complete pipeline: transcribe audio and extract medical data
+
+        Returns one list per column so the caller can build a DataFrame directly.
+        """
         try:
             # Step 1: Transcribe audio
             transcript = self.transcribe_audio(audio_file_path)
@@ -88,21 +158,27 @@ class AudioProcessor:
             # Step 2: Extract medical data
             medical_data = self.extract_medical_data_from_transcript(transcript)
             
-            # Step 3: Convert to standard format
-            lesion_data = []
+            # Step 3: Convert to standard columnar format
+            lesion_data = {
+                'lesao_id': [],
+                'data_exame': [],
+                'tamanho_cm': [],
+                'tratamentos': [],
+                'transcript': [],
+                'observacoes': []
+            }
             
             if medical_data.get('lesoes') and medical_data.get('data_exame'):
+                short_transcript = transcript[:200] + "..." if len(transcript) > 200 else transcript
+                
                 for lesao in medical_data['lesoes']:
                     if lesao.get('identificador') and lesao.get('tamanho_cm'):
-                        data_point = {
-                            'lesao_id': lesao['identificador'],
-                            'data_exame': medical_data['data_exame'],
-                            'tamanho_cm': float(lesao['tamanho_cm']),
-                            'tratamentos': medical_data.get('tratamentos', []),
-                            'transcript': transcript[:200] + "..." if len(transcript) > 200 else transcript,
-                            'observacoes': medical_data.get('observacoes', '')
-                        }
-                        lesion_data.append(data_point)
+                        lesion_data['lesao_id'].append(lesao['identificador'])
+                        lesion_data['data_exame'].append(medical_data['data_exame'])
+                        lesion_data['tamanho_cm'].append(float(lesao['tamanho_cm']))
+                        lesion_data['tratamentos'].append(medical_data.get('tratamentos', []))
+                        lesion_data['transcript'].append(short_transcript)
+                        lesion_data['observacoes'].append(medical_data.get('observacoes', ''))
             
             return lesion_data
             
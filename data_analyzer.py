@@ -2,13 +2,24 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import hashlib
 import logging
+from joblib import Parallel, delayed
+from utils import parse_exam_dates
 
 class DataAnalyzer:
     """Handles lesion data analysis and evolution tracking"""
     
+    # Results shared across instances, keyed by input content (LRU)
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+    _cache_size = 32
+    
     def __init__(self):
         self.variation_threshold = 10.0  # Threshold for significant variation (%)
+        self.surgical_keywords = ['cirurgia', 'ressecção', 'remoção', 'excisão']
     
     def analyze_lesion_evolution(self, df: pd.DataFrame) -> Dict:
         """
@@ -23,6 +34,66 @@ class DataAnalyzer:
         if df.empty:
             return self._empty_results()
         
+        # Reruns with identical input return the memoized result
+        cache_key = self._cache_key(df)
+        with self._cache_lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._fresh_copy(self._cache[cache_key])
+        
+        results = self._analyze(df)
+        
+        with self._cache_lock:
+            self._cache[cache_key] = results
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        
+        return self._fresh_copy(results)
+    
+    def analyze_many(self, patient_dfs: Dict[str, pd.DataFrame], n_jobs: int = -1) -> Dict[str, Dict]:
+        """
+        Analyze several independent patients in parallel worker processes
+        
+        Args:
+            patient_dfs: Mapping of patient id to its lesion DataFrame
+            n_jobs: Number of workers (-1 uses all cores)
+        
+        Returns:
+            Mapping of patient id to the results of analyze_lesion_evolution
+        """
+        if len(patient_dfs) <= 1:
+            return {patient_id: self.analyze_lesion_evolution(df) for patient_id, df in patient_dfs.items()}
+        
+        results = Parallel(n_jobs=n_jobs, backend='loky')(
+            delayed(self.analyze_lesion_evolution)(df) for df in patient_dfs.values()
+        )
+        return dict(zip(patient_dfs.keys(), results))
+    
+    def _cache_key(self, df: pd.DataFrame) -> Tuple[bytes, float]:
+        """Digest of the analysed columns plus the threshold that shapes the result"""
+        keyed = df[['lesao_id', 'data_exame', 'tamanho_cm']]
+        # tratamentos holds lists, which hash_pandas_object cannot hash, but it
+        # drives the surgery status, so it is keyed by its string form
+        if 'tratamentos' in df.columns:
+            keyed = keyed.assign(tratamentos=df['tratamentos'].astype(str))
+        row_hashes = pd.util.hash_pandas_object(keyed, index=False).to_numpy()
+        return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).digest(), self.variation_threshold
+    
+    @staticmethod
+    def _fresh_copy(results: Dict) -> Dict:
+        """Copy of a cached result so callers never share or mutate the cached dict"""
+        return {
+            'summary_table': results['summary_table'].copy(),
+            'detailed_data': results['detailed_data'].copy(),
+            'overall_statistics': dict(results['overall_statistics']),
+            'analysis_metadata': {
+                **results['analysis_metadata'],
+                'analysis_timestamp': datetime.now().isoformat()
+            }
+        }
+    
+    def _analyze(self, df: pd.DataFrame) -> Dict:
+        """Run the full analysis on a non-empty DataFrame"""
         # Ensure data types are correct
         df = self._prepare_dataframe(df)
         
@@ -30,15 +101,7 @@ class DataAnalyzer:
         detailed_data = self._create_detailed_timeline(df)
         
         # Calculate summary statistics for each lesion
-        summary_data = []
-        
-        for lesion_id in df['lesao_id'].unique():
-            lesion_data = df[df['lesao_id'] == lesion_id].copy()
-            lesion_summary = self._analyze_single_lesion(lesion_data)
-            summary_data.append(lesion_summary)
-        
-        # Create summary DataFrame
-        summary_df = pd.DataFrame(summary_data)
+        summary_df = self._summarize_lesions(df)
         
         # Calculate overall statistics
         overall_stats = self._calculate_overall_statistics(summary_df)
@@ -57,13 +120,24 @@ class DataAnalyzer:
     
     def _prepare_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """Prepare and validate DataFrame for analysis"""
-        df_clean = df.copy()
+        # assign returns a new frame, so the caller's DataFrame is left untouched
+        # without an explicit copy (lazy under copy-on-write)
+        typed_columns = {}
         
-        # Convert date column to datetime
-        df_clean['data_exame'] = pd.to_datetime(df_clean['data_exame'])
+        # Convert date column to datetime (skipped when already parsed at ingest)
+        if not pd.api.types.is_datetime64_any_dtype(df['data_exame']):
+            typed_columns['data_exame'] = parse_exam_dates(df['data_exame']).to_numpy()
         
         # Ensure tamanho_cm is numeric
-        df_clean['tamanho_cm'] = pd.to_numeric(df_clean['tamanho_cm'], errors='coerce')
+        if not pd.api.types.is_numeric_dtype(df['tamanho_cm']):
+            typed_columns['tamanho_cm'] = pd.to_numeric(df['tamanho_cm'], errors='coerce')
+        elif df['tamanho_cm'].dtype == np.float32:
+            # Ingest stores sizes as float32; upcast through the shortest decimal form,
+            # as a plain cast keeps the float32 error and can flip a status at the
+            # variation threshold (1.10 -> 1.21 cm would read +10.000001%)
+            typed_columns['tamanho_cm'] = df['tamanho_cm'].to_numpy().astype(str).astype(np.float64)
+        
+        df_clean = df.assign(**typed_columns)
         
         # Remove rows with invalid data
         df_clean = df_clean.dropna(subset=['data_exame', 'tamanho_cm'])
@@ -71,43 +145,90 @@ class DataAnalyzer:
         # Sort by lesion and date
         df_clean = df_clean.sort_values(['lesao_id', 'data_exame'])
         
+        # Group and filter on integer category codes instead of strings
+        if not isinstance(df_clean['lesao_id'].dtype, pd.CategoricalDtype):
+            df_clean['lesao_id'] = df_clean['lesao_id'].astype('category')
+        
         return df_clean
     
     def _create_detailed_timeline(self, df: pd.DataFrame) -> pd.DataFrame:
         """Create detailed timeline with consecutive variations"""
-        detailed_data = []
+        df = df.sort_values(['lesao_id', 'data_exame'])
+        sizes = df['tamanho_cm']
+        
+        # Previous measurement is the last exam of the lesion strictly before this
+        # date: shift the last size of each (lesion, date) group, then broadcast it
+        # back to every exam of that date
+        exam_groups = df.groupby(['lesao_id', 'data_exame'], sort=False, observed=True)
+        last_sizes = exam_groups['tamanho_cm'].last()
+        prev_by_group = last_sizes.groupby(level=0, sort=False, observed=True).shift(1).to_numpy()
+        prev_sizes = pd.Series(prev_by_group[exam_groups.ngroup().to_numpy()], index=df.index)
+        variation_abs = sizes - prev_sizes
+        variation_pct = variation_abs / prev_sizes.where(prev_sizes > 0) * 100
+        
+        if 'tratamentos' in df.columns:
+            treatments = df['tratamentos'].to_numpy()
+        else:
+            treatments = [[] for _ in range(len(df))]
+        
+        return pd.DataFrame({
+            'lesao_id': df['lesao_id'].to_numpy(),
+            'data_exame': df['data_exame'].to_numpy(),
+            'tamanho_cm': sizes.to_numpy(),
+            'variacao_absoluta': variation_abs.to_numpy(),
+            'variacao_percentual': variation_pct.to_numpy(),
+            'tratamentos': treatments
+        })
+    
+    def _summarize_lesions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Build the per-lesion summary table with one grouped aggregation
         
-        for lesion_id in df['lesao_id'].unique():
-            lesion_data = df[df['lesao_id'] == lesion_id].copy()
-            lesion_data = lesion_data.sort_values('data_exame')
-            
-            for i, row in lesion_data.iterrows():
-                # Calculate variation from previous measurement
-                variation_pct = None
-                variation_abs = None
-                
-                if len(lesion_data) > 1:
-                    prev_measurements = lesion_data[lesion_data['data_exame'] < row['data_exame']]
-                    if not prev_measurements.empty:
-                        prev_size = prev_measurements.iloc[-1]['tamanho_cm']
-                        variation_abs = row['tamanho_cm'] - prev_size
-                        variation_pct = (variation_abs / prev_size) * 100 if prev_size > 0 else None
-                
-                detailed_entry = {
-                    'lesao_id': lesion_id,
-                    'data_exame': row['data_exame'],
-                    'tamanho_cm': row['tamanho_cm'],
-                    'variacao_absoluta': variation_abs,
-                    'variacao_percentual': variation_pct,
-                    'tratamentos': row.get('tratamentos', [])
-                }
-                
-                detailed_data.append(detailed_entry)
-        
-        return pd.DataFrame(detailed_data)
+        Expects ``df`` sorted by lesion and date, as returned by ``_prepare_dataframe``.
+        """
+        grouped = df.groupby('lesao_id', sort=False, observed=True)
+        agg = grouped.agg(
+            first_date=('data_exame', 'first'),
+            last_date=('data_exame', 'last'),
+            first_size=('tamanho_cm', 'first'),
+            last_size=('tamanho_cm', 'last'),
+            max_size=('tamanho_cm', 'max'),
+            min_size=('tamanho_cm', 'min'),
+            n=('tamanho_cm', 'size')
+        )
+        
+        # Calculate total variation for all lesions at once
+        first_sizes = agg['first_size'].to_numpy(dtype=float)
+        last_sizes = agg['last_size'].to_numpy(dtype=float)
+        safe_first = np.where(first_sizes > 0, first_sizes, 1.0)
+        variation_pct = np.where(first_sizes > 0, (last_sizes - first_sizes) / safe_first * 100, 0.0)
+        
+        # Trend for all lesions at once
+        trends = self._calculate_trend_statistics_all(df)['trend'].to_numpy()
+        
+        # Status for all lesions at once
+        has_surgery = self._has_surgical_treatment_all(df)
+        statuses = self._determine_lesion_status_all(variation_pct, has_surgery)
+        
+        return pd.DataFrame({
+            'Lesão': agg.index.to_numpy(dtype=object),
+            'Primeira Data': agg['first_date'].dt.strftime('%d/%m/%Y').to_numpy(),
+            'Tamanho Inicial (cm)': agg['first_size'].to_numpy(),
+            'Última Data': agg['last_date'].dt.strftime('%d/%m/%Y').to_numpy(),
+            'Tamanho Final (cm)': agg['last_size'].to_numpy(),
+            'Variação Total (%)': variation_pct,
+            'Status Atual': statuses,
+            'Número de Medições': agg['n'].to_numpy(),
+            'Tendência': trends,
+            'Maior Tamanho (cm)': agg['max_size'].to_numpy(),
+            'Menor Tamanho (cm)': agg['min_size'].to_numpy()
+        })
     
     def _analyze_single_lesion(self, lesion_data: pd.DataFrame) -> Dict:
-        """Analyze evolution of a single lesion"""
+        """Analyze evolution of a single lesion
+        
+        Kept for callers analysing one lesion at a time; the full analysis
+        uses ``_summarize_lesions``.
+        """
         lesion_data = lesion_data.sort_values('data_exame')
         lesion_id = lesion_data.iloc[0]['lesao_id']
         
@@ -152,6 +273,7 @@ class DataAnalyzer:
     def _determine_lesion_status(self, variation_pct: float, first_size: float, 
                                last_size: float, lesion_data: pd.DataFrame) -> str:
         """Determine the current status of a lesion"""
+        surgical_treatments = []
         
         # Check if lesion disappeared (might be surgical removal)
         if len(lesion_data) > 1:
@@ -163,7 +285,7 @@ class DataAnalyzer:
             
             # Look for surgical treatments
             surgical_treatments = [t for t in treatments if any(keyword in t.lower() 
-                                 for keyword in ['cirurgia', 'ressecção', 'remoção', 'excisão'])]
+                                 for keyword in self.surgical_keywords)]
         
         # Categorize based on variation percentage
         if abs(variation_pct) <= self.variation_threshold:
@@ -176,6 +298,49 @@ class DataAnalyzer:
             else:
                 return f"Reduziu {variation_pct:.1f}%"
     
+    def _has_surgical_treatment_all(self, df: pd.DataFrame) -> np.ndarray:
+        """Whether each lesion (in groupby order) has a surgical treatment recorded"""
+        if 'tratamentos' not in df.columns:
+            return np.zeros(df['lesao_id'].nunique(), dtype=bool)
+        
+        # One row per treatment, matched against all keywords in one regex pass
+        treatments = df['tratamentos'].reset_index(drop=True)
+        treatments = treatments.where(treatments.map(lambda t: isinstance(t, list)))
+        exploded = treatments.explode().astype(object)
+        keyword_pattern = '|'.join(self.surgical_keywords)
+        is_surgical = exploded.str.lower().str.contains(keyword_pattern, regex=True, na=False)
+        
+        # Back to one flag per measurement, then per lesion
+        row_flags = is_surgical.groupby(level=0).any().reindex(range(len(df)), fill_value=False)
+        lesion_flags = pd.Series(row_flags.to_numpy(), index=df.index).groupby(
+            df['lesao_id'], sort=False, observed=True
+        ).any()
+        
+        # A single measurement never counts as a disappearance
+        counts = df.groupby('lesao_id', sort=False, observed=True).size()
+        return (lesion_flags & (counts > 1)).to_numpy()
+    
+    def _determine_lesion_status_all(self, variation_pct: np.ndarray, has_surgery: np.ndarray) -> np.ndarray:
+        """Vectorized ``_determine_lesion_status`` over all lesions"""
+        threshold = self.variation_threshold
+        signed_pct = np.char.mod('%+.1f', variation_pct)
+        pct = np.char.mod('%.1f', variation_pct)
+        
+        # Categorize based on variation percentage
+        conditions = [
+            np.abs(variation_pct) <= threshold,
+            variation_pct > threshold,
+            has_surgery
+        ]
+        choices = [
+            np.char.add(np.char.add('Estável (', signed_pct), '%)'),
+            np.char.add(np.char.add('Aumentou ', signed_pct), '%'),
+            np.char.add(np.char.add('Reduziu ', pct), '% (possível intervenção cirúrgica)')
+        ]
+        
+        # The default must be a string too: numpy>=2 has no common dtype for str and int
+        return np.select(conditions, choices, default=np.char.add(np.char.add('Reduziu ', pct), '%'))
+    
     def _calculate_trend_statistics(self, lesion_data: pd.DataFrame) -> Dict:
         """Calculate trend statistics for a lesion"""
         if len(lesion_data) < 2:
@@ -217,6 +382,51 @@ class DataAnalyzer:
         except Exception:
             return {'trend': 'Erro no cálculo', 'slope': 0, 'correlation': 0}
     
+    def _calculate_trend_statistics_all(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Calculate trend statistics for every lesion in one vectorized pass
+        
+        Returns a DataFrame indexed by lesion with ``trend``, ``slope`` and
+        ``correlation`` columns, matching ``_calculate_trend_statistics``.
+        """
+        # Factorize the lesion ids once and reuse the codes for every reduction
+        codes, lesion_index = pd.factorize(df['lesao_id'], sort=False)
+        valid = codes >= 0  # rows without a lesion id are not grouped
+        codes = codes[valid]
+        n_lesions = len(lesion_index)
+        
+        # Dates as nanoseconds, like pd.to_numeric in the per-lesion version
+        dates = df['data_exame']
+        x = (dates - dates.min()).to_numpy(dtype='timedelta64[ns]').astype(np.int64).astype(float)[valid]
+        y = df['tamanho_cm'].to_numpy(dtype=float)[valid]
+        
+        counts = np.bincount(codes, minlength=n_lesions)
+        
+        # Deviations from each lesion's mean keep the sums numerically stable
+        dx = x - (np.bincount(codes, weights=x, minlength=n_lesions) / counts)[codes]
+        dy = y - (np.bincount(codes, weights=y, minlength=n_lesions) / counts)[codes]
+        
+        sxx = np.bincount(codes, weights=dx * dx, minlength=n_lesions)
+        syy = np.bincount(codes, weights=dy * dy, minlength=n_lesions)
+        sxy = np.bincount(codes, weights=dx * dy, minlength=n_lesions)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(sxx != 0, sxy / sxx, 0.0)
+            correlation = np.nan_to_num(sxy / np.sqrt(sxx * syy), nan=0.0, posinf=0.0, neginf=0.0)
+        
+        # Determine trend direction
+        trend = np.select(
+            [counts < 2, np.abs(correlation) < 0.3, correlation > 0.3],
+            ['Dados insuficientes', 'Sem tendência clara', 'Tendência de crescimento'],
+            default='Tendência de redução'
+        )
+        
+        insufficient = counts < 2
+        return pd.DataFrame({
+            'trend': trend,
+            'slope': np.where(insufficient, 0, slope),
+            'correlation': np.where(insufficient, 0, correlation)
+        }, index=pd.Index(lesion_index))
+    
     def _calculate_overall_statistics(self, summary_df: pd.DataFrame) -> Dict:
         """Calculate overall statistics across all lesions"""
         if summary_df.empty:
@@ -280,7 +490,8 @@ class DataAnalyzer:
     def filter_lesions_by_criteria(self, summary_df: pd.DataFrame, 
                                  criteria: Dict[str, any]) -> pd.DataFrame:
         """Filter lesions based on specific criteria"""
-        filtered_df = summary_df.copy()
+        # Every filter below builds a new frame, so no upfront copy is needed
+        filtered_df = summary_df
         
         # Filter by variation threshold
         if 'min_variation' in criteria:
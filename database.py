@@ -1,9 +1,24 @@
 import os
-import psycopg2
+import io
+import csv
+import threading
+from psycopg2 import pool
+from psycopg2.extras import Json, execute_values, register_default_jsonb
+from contextlib import contextmanager
 import pandas as pd
 from datetime import datetime
 from typing import List, Dict, Optional
-import json
+import orjson
+
+# Decode JSONB columns with orjson as rows are fetched
+register_default_jsonb(globally=True, loads=orjson.loads)
+
+# Options for session payloads: numpy values natively, str() for anything else
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _orjson_dumps(obj) -> str:
+    """Serialize to a JSON string with orjson"""
+    return orjson.dumps(obj, default=str, option=ORJSON_OPTIONS).decode()
 
 class DatabaseManager:
     """Manages PostgreSQL database operations for lesion data"""
@@ -16,17 +31,28 @@ class DatabaseManager:
             'user': os.environ.get('PGUSER'),
             'password': os.environ.get('PGPASSWORD')
         }
+        self._pool = None
+        self._pool_lock = threading.Lock()
         self.init_database()
     
+    def _get_pool(self) -> pool.ThreadedConnectionPool:
+        """Create the connection pool on first use"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(1, 10, **self.connection_params)
+        return self._pool
+    
+    @contextmanager
     def get_connection(self):
-        """Get database connection"""
-        return psycopg2.connect(
-            host=self.connection_params['host'],
-            port=self.connection_params['port'],
-            database=self.connection_params['database'],
-            user=self.connection_params['user'],
-            password=self.connection_params['password']
-        )
+        """Check out a pooled database connection"""
+        connection_pool = self._get_pool()
+        conn = connection_pool.getconn()
+        try:
+            # Commit on success, roll back on error, like a plain connection block
+            with conn:
+                yield conn
+        finally:
+            connection_pool.putconn(conn)
     
     def init_database(self):
         """Initialize database tables"""
@@ -59,6 +85,13 @@ class DatabaseManager:
                         )
                     """)
                     
+                    # The UNIQUE constraint already indexes (patient_id, lesion_id, exam_date),
+                    # which serves get_patient_data; add one for COUNT(DISTINCT lesion_id)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_lesions_lesion ON lesions(lesion_id)
+                    """)
+                    cursor.execute("ANALYZE lesions")
+                    
                     # Create analysis_sessions table
                     cursor.execute("""
                         CREATE TABLE IF NOT EXISTS analysis_sessions (
@@ -93,60 +126,145 @@ class DatabaseManager:
     def save_lesion_data(self, patient_id: str, lesion_data: List[Dict]) -> bool:
         """Save lesion measurements to database"""
         try:
+            # One row per (lesion, date): a single INSERT ... ON CONFLICT cannot
+            # update the same row twice, so the last measurement wins as before
+            rows = {
+                (data['lesao_id'], data['data_exame']): (
+                    patient_id,
+                    data['lesao_id'],
+                    data['data_exame'],
+                    data['tamanho_cm'],
+                    Json(data.get('tratamentos', []), dumps=_orjson_dumps),
+                    data.get('observacoes', ''),
+                    data.get('source_file', '')
+                )
+                for data in lesion_data
+            }
+            
             with self.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    for data in lesion_data:
-                        cursor.execute("""
-                            INSERT INTO lesions (patient_id, lesion_id, exam_date, size_cm, treatments, observations, source_file)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (patient_id, lesion_id, exam_date)
-                            DO UPDATE SET 
-                                size_cm = EXCLUDED.size_cm,
-                                treatments = EXCLUDED.treatments,
-                                observations = EXCLUDED.observations,
-                                source_file = EXCLUDED.source_file
-                        """, (
-                            patient_id,
-                            data['lesao_id'],
-                            data['data_exame'],
-                            data['tamanho_cm'],
-                            json.dumps(data.get('tratamentos', [])),
-                            data.get('observacoes', ''),
-                            data.get('source_file', '')
-                        ))
+                    # Send all rows in a single multi-row INSERT
+                    execute_values(cursor, """
+                        INSERT INTO lesions (patient_id, lesion_id, exam_date, size_cm, treatments, observations, source_file)
+                        VALUES %s
+                        ON CONFLICT (patient_id, lesion_id, exam_date)
+                        DO UPDATE SET 
+                            size_cm = EXCLUDED.size_cm,
+                            treatments = EXCLUDED.treatments,
+                            observations = EXCLUDED.observations,
+                            source_file = EXCLUDED.source_file
+                    """, list(rows.values()), page_size=1000)
                     conn.commit()
                     return True
         except Exception as e:
             print(f"Erro ao salvar dados de lesão: {str(e)}")
             return False
     
+    def save_lesion_data_bulk(self, patient_id: str, lesion_data: List[Dict], 
+                              on_conflict: str = 'update') -> bool:
+        """Save a large batch of lesion measurements using COPY
+        
+        Rows are streamed into a temporary staging table and merged into
+        ``lesions`` with a single statement. ``on_conflict`` is ``'update'``
+        (same result as ``save_lesion_data``) or ``'ignore'`` to keep existing rows.
+        """
+        if on_conflict == 'update':
+            conflict_action = """
+                DO UPDATE SET 
+                    size_cm = EXCLUDED.size_cm,
+                    treatments = EXCLUDED.treatments,
+                    observations = EXCLUDED.observations,
+                    source_file = EXCLUDED.source_file
+            """
+        elif on_conflict == 'ignore':
+            conflict_action = "DO NOTHING"
+        else:
+            raise ValueError(f"on_conflict inválido: {on_conflict}")
+        
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for data in lesion_data:
+                writer.writerow([
+                    patient_id,
+                    data['lesao_id'],
+                    data['data_exame'],
+                    data['tamanho_cm'],
+                    _orjson_dumps(data.get('tratamentos', [])),
+                    data.get('observacoes', ''),
+                    data.get('source_file', '')
+                ])
+            buffer.seek(0)
+            
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        CREATE TEMP TABLE lesions_staging (
+                            seq SERIAL,
+                            patient_id VARCHAR(100),
+                            lesion_id VARCHAR(200),
+                            exam_date DATE,
+                            size_cm DECIMAL(10,2),
+                            treatments JSONB,
+                            observations TEXT,
+                            source_file VARCHAR(500)
+                        ) ON COMMIT DROP
+                    """)
+                    
+                    # Empty strings stay empty instead of becoming NULL
+                    cursor.copy_expert("""
+                        COPY lesions_staging (patient_id, lesion_id, exam_date, size_cm, treatments, observations, source_file)
+                        FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (observations, source_file))
+                    """, buffer)
+                    
+                    # Last row per key wins, as with row-by-row upserts
+                    cursor.execute(f"""
+                        INSERT INTO lesions (patient_id, lesion_id, exam_date, size_cm, treatments, observations, source_file)
+                        SELECT DISTINCT ON (patient_id, lesion_id, exam_date)
+                            patient_id, lesion_id, exam_date, size_cm, treatments, observations, source_file
+                        FROM lesions_staging
+                        ORDER BY patient_id, lesion_id, exam_date, seq DESC
+                        ON CONFLICT (patient_id, lesion_id, exam_date)
+                        {conflict_action}
+                    """)
+                    conn.commit()
+                    return True
+        except Exception as e:
+            print(f"Erro ao salvar dados de lesão em lote: {str(e)}")
+            return False
+    
     def get_patient_data(self, patient_id: str) -> pd.DataFrame:
         """Get all lesion data for a patient"""
         try:
+            columns = ('lesao_id', 'data_exame', 'tamanho_cm', 'tratamentos', 'observations', 'source_file')
+            data = {column: [] for column in columns}
+            
             with self.get_connection() as conn:
-                query = """
-                    SELECT lesion_id, exam_date, size_cm, treatments, observations, source_file
-                    FROM lesions 
-                    WHERE patient_id = %s 
-                    ORDER BY lesion_id, exam_date
-                """
-                df = pd.read_sql_query(query, conn, params=[patient_id])
-                
-                # Rename columns to match existing code
-                df = df.rename(columns={
-                    'lesion_id': 'lesao_id',
-                    'exam_date': 'data_exame', 
-                    'size_cm': 'tamanho_cm',
-                    'treatments': 'tratamentos'
-                })
-                
-                # Parse JSON treatments
-                if not df.empty:
-                    df['tratamentos'] = df['tratamentos'].apply(
-                        lambda x: json.loads(x) if x else []
-                    )
-                
-                return df
+                # Named cursor stays server-side, so rows arrive in chunks
+                with conn.cursor(name='stream_patient') as cursor:
+                    cursor.itersize = 5000
+                    # Columns are renamed in SQL to match existing code; JSONB
+                    # treatments are decoded by the driver at fetch time
+                    cursor.execute("""
+                        SELECT lesion_id AS lesao_id,
+                               exam_date AS data_exame,
+                               size_cm::float8 AS tamanho_cm,
+                               COALESCE(treatments, '[]'::jsonb) AS tratamentos,
+                               observations,
+                               source_file
+                        FROM lesions 
+                        WHERE patient_id = %s 
+                        ORDER BY lesion_id, exam_date
+                    """, (patient_id,))
+                    
+                    while True:
+                        rows = cursor.fetchmany(cursor.itersize)
+                        if not rows:
+                            break
+                        for column, values in zip(columns, zip(*rows)):
+                            data[column].extend(values)
+            
+            return pd.DataFrame(data)
         except Exception as e:
             print(f"Erro ao recuperar dados do paciente: {str(e)}")
             return pd.DataFrame()
@@ -177,7 +295,7 @@ class DatabaseManager:
                     cursor.execute("""
                         INSERT INTO analysis_sessions (patient_id, session_data)
                         VALUES (%s, %s)
-                    """, (patient_id, json.dumps(analysis_data, default=str)))
+                    """, (patient_id, _orjson_dumps(analysis_data)))
                     conn.commit()
                     return True
         except Exception as e:
@@ -203,21 +321,17 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Count patients
-                    cursor.execute("SELECT COUNT(*) FROM patients")
-                    patient_count = cursor.fetchone()[0]
-                    
-                    # Count lesions
-                    cursor.execute("SELECT COUNT(*) FROM lesions")
-                    lesion_count = cursor.fetchone()[0]
-                    
-                    # Count unique lesions
-                    cursor.execute("SELECT COUNT(DISTINCT lesion_id) FROM lesions")
-                    unique_lesions = cursor.fetchone()[0]
-                    
-                    # Date range
-                    cursor.execute("SELECT MIN(exam_date), MAX(exam_date) FROM lesions")
-                    date_range = cursor.fetchone()
+                    # Counts and date range in a single round trip
+                    cursor.execute("""
+                        SELECT
+                            (SELECT COUNT(*) FROM patients),
+                            (SELECT COUNT(*) FROM lesions),
+                            (SELECT COUNT(DISTINCT lesion_id) FROM lesions),
+                            (SELECT MIN(exam_date) FROM lesions),
+                            (SELECT MAX(exam_date) FROM lesions)
+                    """)
+                    patient_count, lesion_count, unique_lesions, start_date, end_date = cursor.fetchone()
+                    date_range = (start_date, end_date)
                     
                     return {
                         'total_patients': patient_count,
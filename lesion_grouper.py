@@ -1,8 +1,44 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import re
-from difflib import SequenceMatcher
+import unicodedata
+from rapidfuzz import fuzz
+from functools import lru_cache
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Common patterns: "Lesão A", "Nódulo 1", "Metástase B"
+_PATTERN_RE = re.compile(r'(lesão|nódulo|metástase|tumor|massa)\s*([a-z0-9]+)?')
+_CLEAR_NAME_RE = re.compile(r'(lesão|nódulo|metástase|tumor|massa)\s+[a-z0-9]+')
+_KEY_RE = re.compile(r'(lesão|nódulo|metástase|tumor|massa)\s*(\w+)?')
+
+# Standardize common terms; one alternation replaces all of them in a single scan
+_REPLACEMENTS = {
+    'lesao': 'lesão',
+    'nodulo': 'nódulo', 
+    'metastase': 'metástase',
+    'tumor': 'tumor',
+    'massa': 'massa'
+}
+_REPLACEMENTS_RE = re.compile('|'.join(map(re.escape, _REPLACEMENTS)))
+
+@lru_cache(maxsize=4096)
+def _normalize_lesion_name(name: str) -> str:
+    """Normalize lesion name for comparison (cached, names repeat across exams)"""
+    # Convert to lowercase and remove extra spaces
+    normalized = _WHITESPACE_RE.sub(' ', name.lower()).strip()
+    return _REPLACEMENTS_RE.sub(lambda match: _REPLACEMENTS[match.group(0)], normalized)
+
+@lru_cache(maxsize=4096)
+def _extract_pattern(lowered_name: str) -> Tuple[str, str]:
+    """Extract (base type, identifier) from a lowercased lesion name"""
+    match = _PATTERN_RE.search(lowered_name)
+    
+    if match:
+        return match.group(1), match.group(2) or ''
+    
+    return '', ''
 
 class LesionGrouper:
     """Groups similar lesions based on naming patterns and similarity"""
@@ -10,37 +46,64 @@ class LesionGrouper:
     def __init__(self):
         self.similarity_threshold = 0.8
         
+        # Roman numerals vs letters/numbers
+        self.roman_map = {'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5'}
+        
     def group_similar_lesions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Group lesions with similar names into the same identifier"""
         if df.empty:
             return df
         
-        df_grouped = df.copy()
-        lesion_mapping = self._create_lesion_mapping(list(df['lesao_id'].unique()))
+        # Work on the categories so the mapping costs O(#unique) lookups
+        lesion_ids = pd.Categorical(df['lesao_id'])
+        if len(lesion_ids.categories) == 0:
+            return df
+        
+        # Canonical names depend on order, so grouping sees names as they appear
+        present_codes = lesion_ids.codes[lesion_ids.codes >= 0]
+        lesion_names = list(lesion_ids.categories.take(pd.unique(present_codes)))
+        lesion_mapping = self._create_lesion_mapping(lesion_names)
+        new_names = [lesion_mapping.get(name, name) for name in lesion_ids.categories]
         
-        # Apply mapping to standardize lesion names
-        df_grouped['lesao_id'] = df_grouped['lesao_id'].map(
-            lambda x: lesion_mapping.get(x, x)
-        )
+        # Merging names makes the mapping many-to-one, so categories are
+        # collapsed by re-coding instead of rename_categories
+        category_codes, new_categories = pd.factorize(pd.Index(new_names))
+        codes = np.where(lesion_ids.codes >= 0, category_codes[lesion_ids.codes], -1)
+        grouped_ids = pd.Categorical.from_codes(codes, categories=new_categories)
         
-        return df_grouped
+        # assign returns a new frame without an explicit deep copy
+        return df.assign(lesao_id=grouped_ids)
     
     def _create_lesion_mapping(self, lesion_names: List[str]) -> Dict[str, str]:
         """Create mapping from original names to standardized names"""
         mapping = {}
         groups = []
+        group_norms = []  # normalized name of each group's first lesion
+        groups_by_norm = {}
+        groups_by_key = {}
         
         for lesion in lesion_names:
-            # Check if this lesion belongs to any existing group
-            assigned = False
-            for group in groups:
-                if self._should_group_together(lesion, group[0]):
-                    group.append(lesion)
-                    assigned = True
-                    break
+            norm = self._normalize_lesion_name(lesion)
+            key = self._canonical_key(norm)
+            
+            # Exact match after normalization, then same (type, identifier) bucket
+            group_index = groups_by_norm.get(norm)
+            if group_index is None and key is not None:
+                group_index = groups_by_key.get(key)
+            
+            # Only names without a clear pattern fall back to fuzzy matching
+            if group_index is None and key is None:
+                group_index = self._find_similar_group(norm, group_norms)
             
-            if not assigned:
-                groups.append([lesion])
+            if group_index is None:
+                group_index = len(groups)
+                groups.append([])
+                group_norms.append(norm)
+            
+            groups[group_index].append(lesion)
+            groups_by_norm.setdefault(norm, group_index)
+            if key is not None:
+                groups_by_key.setdefault(key, group_index)
         
         # Create mapping with the "best" name for each group
         for group in groups:
@@ -50,6 +113,29 @@ class LesionGrouper:
         
         return mapping
     
+    def _canonical_key(self, normalized_name: str) -> Optional[Tuple[str, str]]:
+        """Bucket key (type, identifier) for names following a known pattern"""
+        # \w keeps accented identifiers whole ("hepática"), unlike _extract_pattern
+        match = _KEY_RE.search(normalized_name)
+        
+        if not match or not match.group(2):
+            return None
+        
+        # Ignore accents so "hepática" and "hepatica" share a bucket
+        identifier = unicodedata.normalize('NFKD', match.group(2))
+        identifier = ''.join(c for c in identifier if not unicodedata.combining(c))
+        return match.group(1), self.roman_map.get(identifier, identifier)
+    
+    def _find_similar_group(self, normalized_name: str, group_norms: List[str]) -> Optional[int]:
+        """Index of the first group whose name is similar enough, if any"""
+        score_cutoff = self.similarity_threshold * 100
+        
+        for i, group_norm in enumerate(group_norms):
+            if fuzz.ratio(normalized_name, group_norm, score_cutoff=score_cutoff):
+                return i
+        
+        return None
+    
     def _should_group_together(self, lesion1: str, lesion2: str) -> bool:
         """Determine if two lesions should be grouped together"""
         # Normalize names
@@ -61,7 +147,7 @@ class LesionGrouper:
             return True
         
         # Check similarity score
-        similarity = SequenceMatcher(None, norm1, norm2).ratio()
+        similarity = fuzz.ratio(norm1, norm2) / 100.0
         if similarity >= self.similarity_threshold:
             return True
         
@@ -70,25 +156,7 @@ class LesionGrouper:
     
     def _normalize_lesion_name(self, name: str) -> str:
         """Normalize lesion name for comparison"""
-        # Convert to lowercase
-        normalized = name.lower()
-        
-        # Remove extra spaces
-        normalized = re.sub(r'\s+', ' ', normalized).strip()
-        
-        # Standardize common terms
-        replacements = {
-            'lesao': 'lesão',
-            'nodulo': 'nódulo', 
-            'metastase': 'metástase',
-            'tumor': 'tumor',
-            'massa': 'massa'
-        }
-        
-        for old, new in replacements.items():
-            normalized = normalized.replace(old, new)
-        
-        return normalized
+        return _normalize_lesion_name(name)
     
     def _check_pattern_similarity(self, lesion1: str, lesion2: str) -> bool:
         """Check if lesions follow similar naming patterns"""
@@ -112,26 +180,14 @@ class LesionGrouper:
     
     def _extract_pattern(self, lesion: str) -> Dict[str, str]:
         """Extract base type and identifier from lesion name"""
-        # Common patterns: "Lesão A", "Nódulo 1", "Metástase B"
-        pattern = r'(lesão|nódulo|metástase|tumor|massa)\s*([a-z0-9]+)?'
-        match = re.search(pattern, lesion.lower())
-        
-        if match:
-            return {
-                'base': match.group(1),
-                'identifier': match.group(2) or ''
-            }
-        
-        return {'base': '', 'identifier': ''}
+        base, identifier = _extract_pattern(lesion.lower())
+        return {'base': base, 'identifier': identifier}
     
     def _similar_identifiers(self, id1: str, id2: str) -> bool:
         """Check if identifiers are similar enough to group"""
-        # Roman numerals vs letters/numbers
-        roman_map = {'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5'}
-        
         # Normalize identifiers
-        norm_id1 = roman_map.get(id1, id1)
-        norm_id2 = roman_map.get(id2, id2)
+        norm_id1 = self.roman_map.get(id1, id1)
+        norm_id2 = self.roman_map.get(id2, id2)
         
         return norm_id1 == norm_id2
     
@@ -142,7 +198,7 @@ class LesionGrouper:
         
         # Prefer names with clear patterns
         for name in group:
-            if re.search(r'(lesão|nódulo|metástase|tumor|massa)\s+[a-z0-9]+', name.lower()):
+            if _CLEAR_NAME_RE.search(name.lower()):
                 return name
         
         # Return the shortest clear name
@@ -0,0 +1,55 @@
+import os
+import hashlib
+import tempfile
+from typing import Dict, Optional
+import orjson
+
+class LLMCache:
+    """Content-addressable on-disk cache for LLM responses"""
+
+    def __init__(self, cache_dir: str = os.path.join("data", "llm_cache")):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, *segments: str) -> str:
+        """Build a cache key from the model, prompt version and prompt segments"""
+        h = hashlib.sha256()
+        # Length prefixes keep the boundaries between segments unambiguous
+        for segment in segments:
+            encoded = segment.encode("utf-8")
+            h.update(len(encoded).to_bytes(8, "little"))
+            h.update(encoded)
+        return f"{model}:{prompt_version}:{h.hexdigest()}"
+
+    def _path(self, key: str) -> str:
+        """Sharded file path for a key"""
+        digest = key.rsplit(":", 1)[-1]
+        file_name = key.replace(":", "_").replace("/", "_") + ".json"
+        return os.path.join(self.cache_dir, digest[:2], file_name)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response for a key, or None on a miss"""
+        try:
+            with open(self._path(key), "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Erro ao ler cache de resposta: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Dict) -> None:
+        """Store a response atomically so readers never see partial files"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(orjson.dumps(value))
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except Exception as e:
+            print(f"Erro ao gravar cache de resposta: {str(e)}")
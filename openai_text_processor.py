@@ -1,35 +1,105 @@
 import os
-import json
-from typing import List, Dict, Optional
-from openai import OpenAI
+import time
+import asyncio
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Type
+from openai import OpenAI, AsyncOpenAI, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from pydantic import BaseModel, ValidationError
+from llm_cache import LLMCache
+import orjson
 
-class OpenAITextProcessor:
-    """Enhanced text processing using OpenAI for medical report analysis"""
+# Output budget assumed for each request when reserving token capacity
+_OUTPUT_TOKEN_BUDGET = 1024
+
+# Packed requests are kept under this many (estimated) prompt tokens
+_BATCH_PROMPT_TOKENS = 6000
+# Output budget per report in a packed request
+_BATCH_OUTPUT_TOKENS_PER_ITEM = 800
+# Keeps the packed output budget well inside the model's output limit
+_BATCH_MAX_ITEMS = 10
+
+# Retries with validation feedback when a response does not match the schema
+_MAX_VALIDATION_RETRIES = 2
+
+# Back off and retry only when the API reports a rate limit
+_retry_on_rate_limit = retry(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(RateLimitError),
+    reraise=True
+)
+
+class Lesao(BaseModel):
+    """One lesion measurement found in a report"""
+    identificador: str
+    tamanho_cm: float
+
+class Extracao(BaseModel):
+    """Structured extraction of one report, enforced by the API"""
+    data_exame: Optional[str]
+    lesoes: List[Lesao]
+    tratamentos: List[str]
+    confianca: float
+
+class ExtracaoLote(Extracao):
+    """Extraction of one report inside a packed request"""
+    id: int
+
+class ResultadosLote(BaseModel):
+    """Answer to a packed request"""
+    resultados: List[ExtracaoLote]
+
+# Static system prompts: kept byte-identical across calls so the API can
+# reuse its cached prompt prefix; anything per-call goes in user messages
+_MEDICAL_DATA_SYSTEM_PROMPT = """
+    Você é um especialista em análise de laudos médicos oncológicos em português. 
+    Analise o texto de um laudo médico e extraia as seguintes informações com máxima precisão:
     
-    def __init__(self):
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    1. Data do exame (procure por padrões como "Data do Exame:", "Data:", formato DD/MM/AAAA ou AAAA-MM-DD)
+    2. Todas as lesões encontradas com seus identificadores e medidas
+    3. Tratamentos mencionados no texto
     
-    def extract_medical_data_from_text(self, text: str, filename: str = "") -> Dict:
-        """Extract structured medical data from PDF text using GPT-4o"""
-        try:
-            system_prompt = """
-            Você é um especialista em análise de laudos médicos oncológicos em português. 
-            Analise o texto de um laudo médico e extraia as seguintes informações com máxima precisão:
-            
-            1. Data do exame (procure por padrões como "Data do Exame:", "Data:", formato DD/MM/AAAA ou AAAA-MM-DD)
-            2. Todas as lesões encontradas com seus identificadores e medidas
-            3. Tratamentos mencionados no texto
-            
-            IMPORTANTE:
-            - Converta TODAS as medidas para centímetros (mm → cm dividindo por 10)
-            - Identifique lesões por nomes como "Lesão A", "Nódulo B", "Metástase C", etc.
-            - Procure por medidas em formato "X,X cm" ou "X mm"
-            - Se encontrar várias medidas para uma lesão, use a primeira ou mais relevante
-            
-            Responda APENAS em formato JSON válido:
+    IMPORTANTE:
+    - Converta TODAS as medidas para centímetros (mm → cm dividindo por 10)
+    - Identifique lesões por nomes como "Lesão A", "Nódulo B", "Metástase C", etc.
+    - Procure por medidas em formato "X,X cm" ou "X mm"
+    - Se encontrar várias medidas para uma lesão, use a primeira ou mais relevante
+    
+    Responda APENAS em formato JSON válido:
+    {
+        "data_exame": "YYYY-MM-DD ou null se não encontrada",
+        "lesoes": [
             {
+                "identificador": "nome exato da lesão encontrada no texto",
+                "tamanho_cm": número_decimal_em_centímetros
+            }
+        ],
+        "tratamentos": ["lista de tratamentos mencionados"],
+        "confianca": número_de_0_a_1_indicando_confiança_na_extração
+    }
+    """
+
+_BATCH_SYSTEM_PROMPT = """
+    Você é um especialista em análise de laudos médicos oncológicos em português. 
+    Você receberá uma lista JSON de laudos, cada um com "id", "filename" e "text".
+    Para CADA laudo, extraia as seguintes informações com máxima precisão:
+    
+    1. Data do exame (procure por padrões como "Data do Exame:", "Data:", formato DD/MM/AAAA ou AAAA-MM-DD)
+    2. Todas as lesões encontradas com seus identificadores e medidas
+    3. Tratamentos mencionados no texto
+    
+    IMPORTANTE:
+    - Converta TODAS as medidas para centímetros (mm → cm dividindo por 10)
+    - Identifique lesões por nomes como "Lesão A", "Nódulo B", "Metástase C", etc.
+    - Procure por medidas em formato "X,X cm" ou "X mm"
+    - Se encontrar várias medidas para uma lesão, use a primeira ou mais relevante
+    - Retorne exatamente um resultado por laudo, preservando o "id"
+    
+    Responda APENAS em formato JSON válido:
+    {
+        "resultados": [
+            {
+                "id": id_do_laudo_correspondente,
                 "data_exame": "YYYY-MM-DD ou null se não encontrada",
                 "lesoes": [
                     {
@@ -40,95 +110,328 @@ class OpenAITextProcessor:
                 "tratamentos": ["lista de tratamentos mencionados"],
                 "confianca": número_de_0_a_1_indicando_confiança_na_extração
             }
-            """
-            
-            user_prompt = f"""
-            Analise este texto de laudo médico (arquivo: {filename}) e extraia as informações estruturadas:
-            
-            {text}
-            """
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.1
-            )
+        ]
+    }
+    """
+
+_CONTEXT_SYSTEM_PROMPT = """
+    Você é um especialista em análise de laudos médicos oncológicos em português. 
+    Analise o texto com máxima precisão para extrair informações de lesões.
+    
+    REGRAS IMPORTANTES:
+    1. Para DATAS: procure padrões como "Data do Exame: DD/MM/AAAA", "Data: AAAA-MM-DD"
+    2. Para LESÕES: identifique nomes como "Lesão A", "Nódulo B", "Metástase", "Massa", "Tumor"
+    3. Para MEDIDAS: converta mm para cm (divida por 10), mantenha precisão decimal
+    4. Se houver múltiplas medidas para uma lesão, use a mais específica
+    5. Mantenha consistência com nomes de lesões anteriores quando aplicável
+    
+    Responda em JSON válido:
+    {
+        "data_exame": "YYYY-MM-DD",
+        "lesoes": [
+            {
+                "identificador": "nome_da_lesão",
+                "tamanho_cm": valor_decimal
+            }
+        ],
+        "tratamentos": ["tratamentos_mencionados"],
+        "confianca": valor_0_a_1
+    }
+    """
+
+class RateLimiter:
+    """Token bucket that throttles requests before they hit the API's RPM/TPM limits"""
+    
+    def __init__(self, rpm: float, tpm: float):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.available_request_capacity = rpm
+        self.available_token_capacity = tpm
+        self.last_update_time = time.monotonic()
+    
+    def _refill(self):
+        """Restore capacity at rpm/60 and tpm/60 per second"""
+        now = time.monotonic()
+        elapsed = now - self.last_update_time
+        self.available_request_capacity = min(self.rpm, self.available_request_capacity + elapsed * self.rpm / 60)
+        self.available_token_capacity = min(self.tpm, self.available_token_capacity + elapsed * self.tpm / 60)
+        self.last_update_time = now
+    
+    async def acquire(self, tokens: int):
+        """Wait until one request and ``tokens`` tokens are available, then reserve them"""
+        # A single request can never need more than the whole bucket
+        tokens = min(tokens, self.tpm)
+        while True:
+            # Check and reserve without awaiting in between, so coroutines cannot race
+            self._refill()
+            if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                self.available_request_capacity -= 1
+                self.available_token_capacity -= tokens
+                return
             
-            result_text = response.choices[0].message.content
-            if result_text:
-                result = json.loads(result_text)
-                return result
-            else:
-                return self._empty_result()
+            request_wait = (1 - self.available_request_capacity) / (self.rpm / 60)
+            token_wait = (tokens - self.available_token_capacity) / (self.tpm / 60)
+            await asyncio.sleep(max(request_wait, token_wait, 0.01))
+
+class OpenAITextProcessor:
+    """Enhanced text processing using OpenAI for medical report analysis"""
+    
+    def __init__(self):
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+        # do not change this unless explicitly requested by the user
+        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.aclient = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.model = "gpt-4.1"
+        # Bump when prompts change so stale cached responses are not reused
+        self._prompt_version = "v3"
+        self.response_cache = LLMCache()
+        self.rate_limiter = RateLimiter(
+            rpm=float(os.environ.get("OPENAI_RPM", 500)),
+            tpm=float(os.environ.get("OPENAI_TPM", 30000))
+        )
+    
+    def _chat_request(self, messages: List[Dict], schema: Type[BaseModel], temperature: float, 
+                      max_tokens: Optional[int] = None) -> Dict:
+        """Keyword arguments for a schema-enforced chat completion"""
+        request = {
+            "model": self.model,
+            "messages": messages,
+            "response_format": schema,
+            "temperature": temperature
+        }
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+        return request
+    
+    def _messages(self, system_prompt: str, user_messages: List[str]) -> List[Dict]:
+        """Chat messages: the static system prompt followed by the user messages"""
+        return [{"role": "system", "content": system_prompt}] + [
+            {"role": "user", "content": content} for content in user_messages
+        ]
+    
+    def _validation_feedback(self, messages: List[Dict], error: ValidationError) -> List[Dict]:
+        """Messages for a retry that tells the model what was wrong with its answer"""
+        return messages + [{
+            "role": "user",
+            "content": f"Sua resposta anterior tinha um erro: {error}. Corrija e responda novamente."
+        }]
+    
+    @_retry_on_rate_limit
+    def _create_completion(self, request: Dict):
+        """Blocking structured completion with backoff on rate limits"""
+        return self.openai_client.beta.chat.completions.parse(**request)
+    
+    @_retry_on_rate_limit
+    async def _acreate_completion(self, request: Dict):
+        """Async structured completion with backoff on rate limits"""
+        return await self.aclient.beta.chat.completions.parse(**request)
+    
+    def _parse_response(self, response, cache_key: str, use_cache: bool) -> Dict:
+        """Turn a parsed completion into a dict and store it in the response cache"""
+        message = response.choices[0].message
+        if message.refusal or message.parsed is None:
+            return self._empty_result()
+        
+        result = message.parsed.model_dump()
+        if use_cache:
+            self.response_cache.set(cache_key, result)
+        return result
+    
+    def _complete_json(self, system_prompt: str, user_messages: List[str], schema: Type[BaseModel], 
+                       temperature: float, use_cache: bool = True, max_tokens: Optional[int] = None) -> Dict:
+        """Run a structured completion, reusing cached responses for identical prompts"""
+        cache_key = LLMCache.make_key(self.model, self._prompt_version, system_prompt, *user_messages)
+        if use_cache:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        messages = self._messages(system_prompt, user_messages)
+        for attempt in range(_MAX_VALIDATION_RETRIES + 1):
+            try:
+                response = self._create_completion(self._chat_request(messages, schema, temperature, max_tokens))
+                return self._parse_response(response, cache_key, use_cache)
+            except ValidationError as e:
+                if attempt == _MAX_VALIDATION_RETRIES:
+                    raise
+                messages = self._validation_feedback(messages, e)
+                time.sleep(1.0 * (attempt + 1))
+    
+    async def _acomplete_json(self, system_prompt: str, user_messages: List[str], schema: Type[BaseModel], 
+                              temperature: float, use_cache: bool = True) -> Dict:
+        """Async counterpart of _complete_json"""
+        cache_key = LLMCache.make_key(self.model, self._prompt_version, system_prompt, *user_messages)
+        if use_cache:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        messages = self._messages(system_prompt, user_messages)
+        for attempt in range(_MAX_VALIDATION_RETRIES + 1):
+            # Rough estimate: ~4 characters per prompt token plus the output budget
+            prompt_chars = sum(len(message["content"]) for message in messages)
+            await self.rate_limiter.acquire(prompt_chars // 4 + _OUTPUT_TOKEN_BUDGET)
+            try:
+                response = await self._acreate_completion(self._chat_request(messages, schema, temperature))
+                return self._parse_response(response, cache_key, use_cache)
+            except ValidationError as e:
+                if attempt == _MAX_VALIDATION_RETRIES:
+                    raise
+                messages = self._validation_feedback(messages, e)
+                await asyncio.sleep(1.0 * (attempt + 1))
+    
+    def _medical_data_prompts(self, text: str, filename: str) -> Tuple[str, List[str]]:
+        """System prompt and user messages for extract_medical_data_from_text"""
+        system_prompt = _MEDICAL_DATA_SYSTEM_PROMPT
+        
+        user_prompt = f"""
+        Analise este texto de laudo médico (arquivo: {filename}) e extraia as informações estruturadas:
+        
+        {text}
+        """
+        return system_prompt, [user_prompt]
+    
+    def extract_medical_data_from_text(self, text: str, filename: str = "", use_cache: bool = True) -> Dict:
+        """Extract structured medical data from PDF text using GPT-4o"""
+        try:
+            system_prompt, user_messages = self._medical_data_prompts(text, filename)
+            return self._complete_json(system_prompt, user_messages, Extracao, temperature=0.1, use_cache=use_cache)
             
         except Exception as e:
             print(f"Erro ao processar texto com OpenAI: {str(e)}")
             return self._empty_result()
     
-    def improve_extraction_with_context(self, text: str, previous_data: List[Dict] = None) -> Dict:
-        """Improve extraction using context from previous reports"""
+    def _batch_prompts(self, items: List[Tuple[str, str]]) -> Tuple[str, List[str]]:
+        """System prompt and user messages for a packed extract_medical_data_batch request"""
+        system_prompt = _BATCH_SYSTEM_PROMPT
+        
+        user_prompt = orjson.dumps(
+            [{"id": i, "filename": filename, "text": text} for i, (text, filename) in enumerate(items)]
+        ).decode()
+        return system_prompt, [user_prompt]
+    
+    def extract_medical_data_batch(self, items: List[Tuple[str, str]], use_cache: bool = True) -> List[Dict]:
+        """Extract several (text, filename) reports, packing them into as few requests as possible"""
+        results = []
+        for batch in self._pack_batches(items):
+            results.extend(self._extract_medical_data_single_batch(batch, use_cache))
+        return results
+    
+    def _pack_batches(self, items: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """Group reports greedily so each request stays under the prompt token target"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for item in items:
+            # ~4 characters per token
+            tokens = (len(item[0]) + len(item[1])) // 4
+            if current and (current_tokens + tokens > _BATCH_PROMPT_TOKENS or len(current) >= _BATCH_MAX_ITEMS):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _extract_medical_data_single_batch(self, items: List[Tuple[str, str]], use_cache: bool = True) -> List[Dict]:
+        """Send one packed request; reports missing from the answer are retried one by one"""
+        if len(items) == 1:
+            return [self.extract_medical_data_from_text(items[0][0], items[0][1], use_cache)]
+        
+        by_id = {}
         try:
-            context_info = ""
-            if previous_data:
-                lesion_names = set()
-                for data in previous_data:
-                    if 'lesao_id' in data:
-                        lesion_names.add(data['lesao_id'])
-                
-                if lesion_names:
-                    context_info = f"\nCONTEXTO: Este paciente já teve as seguintes lesões identificadas anteriormente: {', '.join(lesion_names)}. Use nomes consistentes quando possível."
-            
-            system_prompt = f"""
-            Você é um especialista em análise de laudos médicos oncológicos em português. 
-            Analise o texto com máxima precisão para extrair informações de lesões.
-            
-            {context_info}
-            
-            REGRAS IMPORTANTES:
-            1. Para DATAS: procure padrões como "Data do Exame: DD/MM/AAAA", "Data: AAAA-MM-DD"
-            2. Para LESÕES: identifique nomes como "Lesão A", "Nódulo B", "Metástase", "Massa", "Tumor"
-            3. Para MEDIDAS: converta mm para cm (divida por 10), mantenha precisão decimal
-            4. Se houver múltiplas medidas para uma lesão, use a mais específica
-            5. Mantenha consistência com nomes de lesões anteriores quando aplicável
-            
-            Responda em JSON válido:
-            {
-                "data_exame": "YYYY-MM-DD",
-                "lesoes": [
-                    {
-                        "identificador": "nome_da_lesão",
-                        "tamanho_cm": valor_decimal
-                    }
-                ],
-                "tratamentos": ["tratamentos_mencionados"],
-                "confianca": valor_0_a_1
-            }
-            """
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Texto do laudo:\n{text}"}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.0
-            )
+            system_prompt, user_messages = self._batch_prompts(items)
+            result = self._complete_json(system_prompt, user_messages, ResultadosLote, temperature=0.1, 
+                                         use_cache=use_cache, max_tokens=_BATCH_OUTPUT_TOKENS_PER_ITEM * len(items))
+            for entry in result.get('resultados', []):
+                by_id[entry['id']] = entry
+        except Exception as e:
+            print(f"Erro ao processar lote com OpenAI: {str(e)}")
+        
+        return [
+            by_id[i] if i in by_id else self.extract_medical_data_from_text(text, filename, use_cache)
+            for i, (text, filename) in enumerate(items)
+        ]
+    
+    def _context_prompts(self, text: str, previous_data: Optional[List[Dict]]) -> Tuple[str, List[str]]:
+        """System prompt and user messages for improve_extraction_with_context"""
+        system_prompt = _CONTEXT_SYSTEM_PROMPT
+        user_messages = []
+        
+        if previous_data:
+            lesion_names = set()
+            for data in previous_data:
+                if 'lesao_id' in data:
+                    lesion_names.add(data['lesao_id'])
             
-            result_text = response.choices[0].message.content
-            if result_text:
-                return json.loads(result_text)
-            else:
-                return self._empty_result()
+            if lesion_names:
+                # Sorted so identical context produces identical messages
+                user_messages.append(
+                    f"CONTEXTO: Este paciente já teve as seguintes lesões identificadas anteriormente: "
+                    f"{', '.join(sorted(lesion_names))}. Use nomes consistentes quando possível."
+                )
+        
+        user_messages.append(f"Texto do laudo:\n{text}")
+        return system_prompt, user_messages
+    
+    def improve_extraction_with_context(self, text: str, previous_data: List[Dict] = None, 
+                                        use_cache: bool = True) -> Dict:
+        """Improve extraction using context from previous reports"""
+        try:
+            system_prompt, user_messages = self._context_prompts(text, previous_data)
+            return self._complete_json(system_prompt, user_messages, Extracao, temperature=0.0, use_cache=use_cache)
             
         except Exception as e:
             print(f"Erro na extração melhorada: {str(e)}")
             return self._empty_result()
     
+    async def _aextract(self, text: str, filename: str, sem: asyncio.Semaphore, 
+                        use_cache: bool = True) -> Dict:
+        """Async extract_medical_data_from_text bounded by a semaphore"""
+        try:
+            system_prompt, user_messages = self._medical_data_prompts(text, filename)
+            async with sem:
+                return await self._acomplete_json(system_prompt, user_messages, Extracao, temperature=0.1, use_cache=use_cache)
+        except Exception as e:
+            print(f"Erro ao processar texto com OpenAI: {str(e)}")
+            return self._empty_result()
+    
+    async def extract_batch(self, items: List[Tuple[str, str]], max_concurrency: int = 10, 
+                            use_cache: bool = True) -> List[Dict]:
+        """Run extract_medical_data_from_text concurrently for (text, filename) pairs"""
+        sem = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*[self._aextract(text, filename, sem, use_cache) for text, filename in items])
+    
+    async def extract_batch_as_completed(self, items: List[Tuple[str, str]], max_concurrency: int = 10, 
+                                         use_cache: bool = True) -> AsyncIterator[Tuple[int, Dict]]:
+        """Like extract_batch, but yield (index, result) pairs as each request finishes"""
+        sem = asyncio.Semaphore(max_concurrency)
+        
+        async def indexed(i: int, text: str, filename: str) -> Tuple[int, Dict]:
+            return i, await self._aextract(text, filename, sem, use_cache)
+        
+        for next_done in asyncio.as_completed([indexed(i, text, filename) for i, (text, filename) in enumerate(items)]):
+            yield await next_done
+    
+    async def _aimprove(self, text: str, previous_data: Optional[List[Dict]], sem: asyncio.Semaphore, 
+                        use_cache: bool = True) -> Dict:
+        """Async improve_extraction_with_context bounded by a semaphore"""
+        try:
+            system_prompt, user_messages = self._context_prompts(text, previous_data)
+            async with sem:
+                return await self._acomplete_json(system_prompt, user_messages, Extracao, temperature=0.0, use_cache=use_cache)
+        except Exception as e:
+            print(f"Erro na extração melhorada: {str(e)}")
+            return self._empty_result()
+    
+    async def improve_batch(self, items: List[Tuple[str, Optional[List[Dict]]]], max_concurrency: int = 10, 
+                            use_cache: bool = True) -> List[Dict]:
+        """Run improve_extraction_with_context concurrently for (text, previous_data) pairs"""
+        sem = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*[self._aimprove(text, previous_data, sem, use_cache) for text, previous_data in items])
+    
     def validate_and_clean_data(self, extracted_data: Dict) -> Dict:
         """Validate and clean extracted data"""
         try:
@@ -139,37 +442,25 @@ class OpenAITextProcessor:
                 "confianca": 0.0
             }
             
-            # Validate date
+            # Types are enforced by the response schema; only values need checking
             if extracted_data.get('data_exame') and extracted_data['data_exame'] != "null":
                 cleaned_data["data_exame"] = extracted_data['data_exame']
             
-            # Validate lesions
-            if extracted_data.get('lesoes'):
-                for lesao in extracted_data['lesoes']:
-                    if (lesao.get('identificador') and 
-                        lesao.get('tamanho_cm') and 
-                        isinstance(lesao['tamanho_cm'], (int, float)) and 
-                        lesao['tamanho_cm'] > 0):
-                        
-                        cleaned_data["lesoes"].append({
-                            "identificador": str(lesao['identificador']).strip(),
-                            "tamanho_cm": round(float(lesao['tamanho_cm']), 2)
-                        })
+            # Keep lesions with a name and a positive size
+            for lesao in extracted_data.get('lesoes', []):
+                if lesao['identificador'].strip() and lesao['tamanho_cm'] > 0:
+                    cleaned_data["lesoes"].append({
+                        "identificador": lesao['identificador'].strip(),
+                        "tamanho_cm": round(lesao['tamanho_cm'], 2)
+                    })
             
-            # Validate treatments
-            if extracted_data.get('tratamentos'):
-                cleaned_data["tratamentos"] = [
-                    str(t).strip() for t in extracted_data['tratamentos'] 
-                    if t and str(t).strip()
-                ]
+            # Drop blank treatments
+            cleaned_data["tratamentos"] = [
+                t.strip() for t in extracted_data.get('tratamentos', []) if t.strip()
+            ]
             
-            # Validate confidence
-            if extracted_data.get('confianca'):
-                try:
-                    confidence = float(extracted_data['confianca'])
-                    cleaned_data["confianca"] = max(0.0, min(1.0, confidence))
-                except:
-                    cleaned_data["confianca"] = 0.5
+            # Clamp confidence to [0, 1]
+            cleaned_data["confianca"] = max(0.0, min(1.0, extracted_data.get('confianca', 0.0)))
             
             return cleaned_data
             
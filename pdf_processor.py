@@ -1,13 +1,38 @@
+import io
+import os
+import asyncio
+import hashlib
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
+try:
+    import pypdfium2
+except ImportError:  # PyPDF2 alone still works, just slower
+    pypdfium2 = None
+try:
+    import hyperscan
+except ImportError:  # optional: validation falls back to the re patterns
+    hyperscan = None
 import re
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple, Union
 import logging
 from openai_text_processor import OpenAITextProcessor
 
+# Pattern ids in the optional Hyperscan database
+_SCAN_LESION, _SCAN_MEASURE, _SCAN_REPORT = range(3)
+
+def _extract_one(pdf_path: str) -> str:
+    """Worker for extract_texts_parallel (module level so it can be pickled)"""
+    return PDFProcessor._extract_text(pdf_path)
+
 class PDFProcessor:
     """Handles PDF text extraction and medical data parsing"""
     
+    # Extracted text is cached on disk by the sha256 of the PDF bytes
+    _text_cache_dir = Path("data") / "pdf_text_cache"
+    
     def __init__(self):
         # Initialize OpenAI processor for enhanced extraction
         self.openai_processor = OpenAITextProcessor()
@@ -19,20 +44,20 @@ class PDFProcessor:
             r'(\d{4}[/\-]\d{1,2}[/\-]\d{1,2})'
         ]
         
-        # Fallback patterns for lesion identification and measurement
-        self.lesion_patterns = [
+        # Fallback prefixes for lesion identification; all share the measurement tail
+        self.lesion_prefixes = [
             # Lesão A: 1,2 cm
-            r'([Ll]es[ãa]o\s+[A-Za-z0-9]+)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)',
+            r'[Ll]es[ãa]o\s+[A-Za-z0-9]+',
             # Nódulo B: 0,8 cm
-            r'([Nn][óo]dulo\s+[A-Za-z0-9]+)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)',
+            r'[Nn][óo]dulo\s+[A-Za-z0-9]+',
             # Metástase C: 1.5 cm
-            r'([Mm]et[áa]stase\s+[A-Za-z0-9]+)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)',
+            r'[Mm]et[áa]stase\s+[A-Za-z0-9]+',
             # Massa D: 2,3 cm
-            r'([Mm]assa\s+[A-Za-z0-9]+)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)',
+            r'[Mm]assa\s+[A-Za-z0-9]+',
             # Tumor E: 1,8 cm
-            r'([Tt]umor\s+[A-Za-z0-9]+)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)',
+            r'[Tt]umor\s+[A-Za-z0-9]+',
             # Generic pattern: <identifier>: <number> cm/mm
-            r'([A-Za-z]+\s*[A-Za-z0-9]*)[:\s]*([0-9]+[,\.][0-9]+)\s*(cm|mm)'
+            r'[A-Za-z]+\s*[A-Za-z0-9]*'
         ]
         
         # Treatment keywords for context
@@ -40,30 +65,187 @@ class PDFProcessor:
             'cirurgia', 'ressecção', 'quimioterapia', 'radioterapia', 
             'tratamento', 'remoção', 'excisão', 'ablação'
         ]
+        
+        # Compile every pattern once, with case-insensitivity baked in
+        self._date_res = [re.compile(p, re.IGNORECASE) for p in self.date_patterns]
+        # One alternation scans the text once; specific prefixes are tried
+        # before the generic one at each position
+        self._lesion_fused = re.compile(
+            r'(?P<id>' + '|'.join(f'(?:{p})' for p in self.lesion_prefixes) + r')'
+            r'[:\s]*(?P<size>[0-9]+[,\.][0-9]+)\s*(?P<unit>cm|mm)',
+            re.IGNORECASE
+        )
+        self._treat_re = re.compile('|'.join(map(re.escape, self.treatment_keywords)), re.IGNORECASE)
+        self._date_split_re = re.compile(r'[/\-]')
+        # Same substring semantics as checking each keyword against text.lower()
+        self._report_keyword_re = re.compile(
+            '|'.join(map(re.escape, ['laudo', 'exame', 'ressonância', 'tomografia', 'ultrassom', 'raio-x'])),
+            re.IGNORECASE
+        )
+        self._measure_re = re.compile(r'\d+[,\.]\d+\s*(cm|mm)', re.IGNORECASE)
+        
+        # Validation presence checks in a single Hyperscan pass when available
+        self._scan_db = self._build_scan_database() if hyperscan is not None else None
+    
+    def _build_scan_database(self):
+        """Compile the validation patterns into one Hyperscan database"""
+        # Hyperscan needs plain groups and reports presence only, which is all validation uses
+        expressions = {
+            _SCAN_LESION: r'(?:' + '|'.join(self.lesion_prefixes) + r')[:\s]*[0-9]+[,\.][0-9]+\s*(?:cm|mm)',
+            _SCAN_MEASURE: self._measure_re.pattern,
+            _SCAN_REPORT: self._report_keyword_re.pattern
+        }
+        flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP | hyperscan.HS_FLAG_SINGLEMATCH
+        try:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=[pattern.encode('utf-8') for pattern in expressions.values()],
+                ids=list(expressions.keys()),
+                elements=len(expressions),
+                flags=[flags] * len(expressions)
+            )
+            return database
+        except Exception as e:
+            print(f"Erro ao compilar padrões no Hyperscan, usando re: {str(e)}")
+            return None
+    
+    def _scan_validation_hits(self, text: str) -> set:
+        """Ids of the validation patterns found in the text"""
+        hits = set()
+        
+        def on_match(pattern_id, start, end, flags, context):
+            hits.add(pattern_id)
+        
+        self._scan_db.scan(text.encode('utf-8'), match_event_handler=on_match)
+        return hits
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text content from PDF file"""
+        return self._extract_text(pdf_path)
+    
+    def extract_text_from_bytes(self, pdf_bytes: bytes) -> str:
+        """Extract text content from an in-memory PDF"""
+        return self._extract_text(pdf_bytes)
+    
+    def extract_texts_parallel(self, pdf_paths: List[str], workers: Optional[int] = None) -> Dict[str, str]:
+        """Extract text from many PDF files using all CPU cores"""
+        if not pdf_paths:
+            return {}
+        
+        # Larger chunks amortize IPC while still keeping every worker busy
+        n_workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(pdf_paths) // (n_workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(pdf_paths, executor.map(_extract_one, pdf_paths, chunksize=chunksize)))
+    
+    @staticmethod
+    def _extract_text(pdf_source: Union[str, bytes]) -> str:
+        """Extract text from a PDF given as a path or raw bytes, reusing cached results"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                return text.strip()
+            if isinstance(pdf_source, bytes):
+                pdf_bytes = pdf_source
+            else:
+                with open(pdf_source, 'rb') as file:
+                    pdf_bytes = file.read()
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
+        
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        cache_path = PDFProcessor._text_cache_dir / digest[:2] / f"{digest}.txt"
+        try:
+            return cache_path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Erro ao ler cache de texto do PDF: {str(e)}")
+        
+        text = PDFProcessor._parse_text(pdf_bytes)
+        PDFProcessor._write_text_cache(cache_path, text)
+        return text
+    
+    @staticmethod
+    def _write_text_cache(cache_path: Path, text: str):
+        """Store extracted text atomically so readers never see partial files"""
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, cache_path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except Exception as e:
+            print(f"Erro ao gravar cache de texto do PDF: {str(e)}")
+    
+    @staticmethod
+    def _parse_text(pdf_source: Union[str, bytes]) -> str:
+        """Extract text from a PDF given as a path or raw bytes"""
+        try:
+            text = PDFProcessor._extract_text_with_pdfium(pdf_source) if pypdfium2 is not None else ""
+            
+            # Fall back to PyPDF2 if PDFium is unavailable or yields no text
+            if not text:
+                text = PDFProcessor._extract_text_with_pypdf2(pdf_source)
+            
+            return text
         
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
     
+    @staticmethod
+    def _extract_text_with_pdfium(pdf_source: Union[str, bytes]) -> str:
+        """Extract text using PDFium (fast native backend)"""
+        pdf = pypdfium2.PdfDocument(pdf_source)
+        try:
+            parts = []
+            
+            for page in pdf:
+                # Close native handles explicitly instead of waiting for GC
+                textpage = page.get_textpage()
+                try:
+                    parts.append(textpage.get_text_range())
+                    parts.append("\n")
+                finally:
+                    textpage.close()
+                    page.close()
+            
+            return "".join(parts).strip()
+        finally:
+            pdf.close()
+    
+    @staticmethod
+    def _extract_text_with_pypdf2(pdf_source: Union[str, bytes]) -> str:
+        """Extract text using PyPDF2"""
+        if isinstance(pdf_source, bytes):
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_source))
+            return PDFProcessor._join_pypdf2_pages(pdf_reader)
+        
+        with open(pdf_source, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return PDFProcessor._join_pypdf2_pages(pdf_reader)
+    
+    @staticmethod
+    def _join_pypdf2_pages(pdf_reader: PyPDF2.PdfReader) -> str:
+        """Concatenate the text of every page read by PyPDF2"""
+        parts = []
+        
+        for page in pdf_reader.pages:
+            # Pages without extractable text may return None
+            parts.append(page.extract_text() or "")
+            parts.append("\n")
+        
+        return "".join(parts).strip()
+    
     def extract_date(self, text: str) -> Optional[str]:
         """Extract exam date from text"""
-        for pattern in self.date_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                date_str = matches[0]
+        for date_re in self._date_res:
+            # Only the first hit is used, so stop scanning there
+            match = date_re.search(text)
+            if match:
                 # Try to parse and standardize date
-                return self._standardize_date(date_str)
+                return self._standardize_date(match.group(1))
         
         return None
     
@@ -72,7 +254,27 @@ class PDFProcessor:
         # Remove any extra whitespace
         date_str = date_str.strip()
         
-        # Try different date formats
+        # Fast path: classify the numeric fields instead of probing strptime formats
+        parts = self._date_split_re.split(date_str)
+        separators = self._date_split_re.findall(date_str)
+        if len(parts) == 3 and len(set(separators)) == 1 and all(part.isdecimal() for part in parts):
+            first, second, third = (int(part) for part in parts)
+            if len(parts[0]) == 4:
+                candidates = [(first, second, third)]
+            elif len(parts[2]) == 4:
+                # Day first (Portuguese default), then month first
+                candidates = [(third, second, first), (third, first, second)]
+            else:
+                candidates = []
+            
+            for year, month, day in candidates:
+                try:
+                    datetime(year, month, day)  # rejects impossible dates
+                except ValueError:
+                    continue
+                return f"{year:04d}-{month:02d}-{day:02d}"
+        
+        # Fall back to trying different date formats
         date_formats = [
             '%d/%m/%Y', '%d-%m-%Y',
             '%Y/%m/%d', '%Y-%m-%d',
@@ -93,31 +295,22 @@ class PDFProcessor:
         """Extract lesion identifiers and measurements from text"""
         lesions = []
         
-        for pattern in self.lesion_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for match in self._lesion_fused.finditer(text):
+            # Clean and standardize lesion identifier
+            lesion_id = self._clean_lesion_id(match.group('id'))
             
-            for match in matches:
-                if len(match) == 3:
-                    lesion_id, size_str, unit = match
-                    
-                    # Clean and standardize lesion identifier
-                    lesion_id = self._clean_lesion_id(lesion_id)
-                    
-                    # Convert size to float and standardize to cm
-                    size_cm = self._convert_to_cm(size_str, unit)
-                    
-                    if lesion_id and size_cm is not None:
-                        lesions.append((lesion_id, size_cm))
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_lesions = []
+            # Convert size to float and standardize to cm
+            size_cm = self._convert_to_cm(match.group('size'), match.group('unit'))
+            
+            if lesion_id and size_cm is not None:
+                lesions.append((lesion_id, size_cm))
+        
+        # Remove duplicates while preserving order; the first size seen wins
+        unique_lesions = {}
         for lesion_id, size in lesions:
-            if lesion_id not in seen:
-                unique_lesions.append((lesion_id, size))
-                seen.add(lesion_id)
+            unique_lesions.setdefault(lesion_id, size)
         
-        return unique_lesions
+        return list(unique_lesions.items())
     
     def _clean_lesion_id(self, lesion_id: str) -> str:
         """Clean and standardize lesion identifier"""
@@ -152,69 +345,150 @@ class PDFProcessor:
     
     def detect_treatment_context(self, text: str) -> List[str]:
         """Detect treatment mentions in the text"""
-        treatments_found = []
-        
-        for keyword in self.treatment_keywords:
-            if re.search(keyword, text, re.IGNORECASE):
-                treatments_found.append(keyword.capitalize())
-        
-        return treatments_found
+        # One scan for all keywords; results keep the keyword list order
+        found = {match.lower() for match in self._treat_re.findall(text)}
+        return [keyword.capitalize() for keyword in self.treatment_keywords if keyword in found]
     
     def extract_lesion_data(self, pdf_path: str) -> List[Dict]:
         """Main method to extract all lesion data from a PDF using OpenAI enhancement"""
         try:
             # Extract text from PDF
             text = self.extract_text_from_pdf(pdf_path)
-            
-            # Try OpenAI-enhanced extraction first
+            return self._extract_lesion_data_from_text(text, pdf_path)
+        
+        except Exception as e:
+            raise Exception(f"Erro ao processar PDF {pdf_path}: {str(e)}")
+    
+    def extract_lesion_data_from_bytes(self, pdf_bytes: bytes, source_name: str = "") -> List[Dict]:
+        """Extract all lesion data from an in-memory PDF, without a temporary file"""
+        try:
+            # Extract text from PDF
+            text = self.extract_text_from_bytes(pdf_bytes)
+            return self._extract_lesion_data_from_text(text, source_name)
+        
+        except Exception as e:
+            raise Exception(f"Erro ao processar PDF {source_name}: {str(e)}")
+    
+    def extract_lesion_data_batch(self, files: List[Tuple[bytes, str]], max_concurrency: int = 10,
+                                  on_result: Optional[Callable[[int, List[Dict], Optional[str]], None]] = None
+                                  ) -> List[Tuple[List[Dict], Optional[str]]]:
+        """
+        Extract lesion data from several in-memory PDFs with concurrent OpenAI calls
+        
+        Args:
+            files: List of (pdf_bytes, source_name) pairs
+            max_concurrency: Maximum number of OpenAI requests in flight
+            on_result: Called with (file index, lesion_data, error) as soon as each
+                file is done, in completion order, so callers can report progress
+        
+        Returns:
+            One (lesion_data, error) pair per file, in input order
+        """
+        results: List[Tuple[List[Dict], Optional[str]]] = [([], None) for _ in files]
+        
+        def finish(i: int, lesion_data: List[Dict], error: Optional[str]):
+            results[i] = (lesion_data, error)
+            if on_result is not None:
+                on_result(i, lesion_data, error)
+        
+        # Text extraction stays sequential: PDFium is not thread-safe
+        texts = []
+        for i, (pdf_bytes, source_name) in enumerate(files):
+            try:
+                texts.append(self.extract_text_from_bytes(pdf_bytes))
+            except Exception as e:
+                texts.append(None)
+                finish(i, [], f"Erro ao processar PDF {source_name}: {str(e)}")
+        
+        pending = [i for i, text in enumerate(texts) if text is not None]
+        
+        async def extract_pending():
+            async for j, extracted_data in self.openai_processor.extract_batch_as_completed(
+                [(texts[i], files[i][1]) for i in pending], max_concurrency=max_concurrency
+            ):
+                i = pending[j]
+                source_name = files[i][1]
+                try:
+                    lesion_data = self._lesion_data_from_extraction(extracted_data, texts[i], source_name)
+                except Exception as e:
+                    finish(i, [], f"Erro ao processar PDF {source_name}: {str(e)}")
+                else:
+                    finish(i, lesion_data, None)
+        
+        if pending:
+            asyncio.run(extract_pending())
+        
+        return results
+    
+    def _extract_lesion_data_from_text(self, text: str, source_name: str) -> List[Dict]:
+        """Extract lesion data from report text, falling back to regex patterns"""
+        # Try OpenAI-enhanced extraction first
+        try:
+            extracted_data = self.openai_processor.extract_medical_data_from_text(text, source_name)
+        except Exception as openai_error:
+            print(f"OpenAI extraction failed, using fallback: {str(openai_error)}")
+            extracted_data = None
+        
+        return self._lesion_data_from_extraction(extracted_data, text, source_name)
+    
+    def _lesion_data_from_extraction(self, extracted_data: Optional[Dict], text: str, 
+                                     source_name: str) -> List[Dict]:
+        """Use an OpenAI extraction result when valid, falling back to regex patterns"""
+        if extracted_data is not None:
             try:
-                extracted_data = self.openai_processor.extract_medical_data_from_text(text, pdf_path)
                 validated_data = self.openai_processor.validate_and_clean_data(extracted_data)
                 
                 if validated_data['lesoes'] and validated_data['data_exame']:
-                    return self.openai_processor.convert_to_standard_format(validated_data, pdf_path)
+                    return self.openai_processor.convert_to_standard_format(validated_data, source_name)
             except Exception as openai_error:
                 print(f"OpenAI extraction failed, using fallback: {str(openai_error)}")
-            
-            # Fallback to regex-based extraction
-            exam_date = self.extract_date(text)
-            if not exam_date:
-                return []
-            
-            lesions = self.extract_lesions(text)
-            if not lesions:
-                return []
-            
-            treatments = self.detect_treatment_context(text)
-            
-            # Build data structure
-            lesion_data = []
-            for lesion_id, size_cm in lesions:
-                data_point = {
-                    'lesao_id': lesion_id,
-                    'data_exame': exam_date,
-                    'tamanho_cm': size_cm,
-                    'tratamentos': treatments if treatments else [],
-                    'source_file': pdf_path
-                }
-                lesion_data.append(data_point)
-            
-            return lesion_data
         
-        except Exception as e:
-            raise Exception(f"Erro ao processar PDF {pdf_path}: {str(e)}")
+        # Fallback to regex-based extraction
+        exam_date = self.extract_date(text)
+        if not exam_date:
+            return []
+        
+        lesions = self.extract_lesions(text)
+        if not lesions:
+            return []
+        
+        treatments = self.detect_treatment_context(text)
+        
+        # Build data structure
+        lesion_data = []
+        for lesion_id, size_cm in lesions:
+            data_point = {
+                'lesao_id': lesion_id,
+                'data_exame': exam_date,
+                'tamanho_cm': size_cm,
+                'tratamentos': treatments if treatments else [],
+                'source_file': source_name
+            }
+            lesion_data.append(data_point)
+        
+        return lesion_data
     
     def validate_pdf_content(self, pdf_path: str) -> Dict[str, bool]:
         """Validate if PDF contains required medical report elements"""
         try:
             text = self.extract_text_from_pdf(pdf_path)
             
+            if self._scan_db is not None:
+                hits = self._scan_validation_hits(text)
+                return {
+                    # Dates must also parse, so they keep the re path
+                    'has_date': self.extract_date(text) is not None,
+                    'has_lesions': _SCAN_LESION in hits,
+                    'has_measurements': _SCAN_MEASURE in hits,
+                    'is_medical_report': _SCAN_REPORT in hits
+                }
+            
             validation_results = {
                 'has_date': self.extract_date(text) is not None,
-                'has_lesions': len(self.extract_lesions(text)) > 0,
-                'has_measurements': bool(re.search(r'\d+[,\.]\d+\s*(cm|mm)', text, re.IGNORECASE)),
-                'is_medical_report': any(keyword in text.lower() for keyword in 
-                                       ['laudo', 'exame', 'ressonância', 'tomografia', 'ultrassom', 'raio-x'])
+                # Any fused match yields a valid lesion, so the first one is enough
+                'has_lesions': self._lesion_fused.search(text) is not None,
+                'has_measurements': bool(self._measure_re.search(text)),
+                'is_medical_report': bool(self._report_keyword_re.search(text))
             }
             
             return validation_results
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import random
 from typing import List, Dict
 
 class SyntheticDataGenerator:
@@ -24,40 +23,45 @@ class SyntheticDataGenerator:
     def generate_patient_data(self, num_exams: int = 6, num_lesions: int = 4) -> List[Dict]:
         """Generate synthetic patient data with realistic lesion evolution"""
         
+        # Draw every random value up front from a single generator
+        rng = np.random.default_rng()
+        lesion_indices = rng.choice(len(self.lesion_types), size=num_lesions, replace=False)
+        evolution_types = rng.choice(['growing', 'shrinking', 'stable', 'fluctuating'], size=num_lesions)
+        initial_sizes = np.round(rng.uniform(0.5, 3.0, num_lesions), 2)
+        treatment_indices = rng.integers(0, len(self.treatments), size=num_lesions)
+        disappears = rng.random((num_lesions, num_exams)) < 0.3
+        
         # Generate exam dates (every 2-3 months)
         start_date = datetime.now() - timedelta(days=365)
-        exam_dates = []
-        current_date = start_date
+        gaps = rng.integers(60, 91, size=num_exams)
+        exam_dates = [
+            (start_date + timedelta(days=int(offset))).strftime('%Y-%m-%d')
+            for offset in np.cumsum(gaps) - gaps
+        ]
         
-        for i in range(num_exams):
-            exam_dates.append(current_date.strftime('%Y-%m-%d'))
-            current_date += timedelta(days=random.randint(60, 90))
+        # Sizes for every lesion and exam in one vectorized pass
+        sizes = self._calculate_lesion_sizes(initial_sizes, evolution_types, num_exams, rng)
         
         # Generate lesions with evolution patterns
         all_data = []
-        selected_lesions = random.sample(self.lesion_types, num_lesions)
-        
-        for lesion_id in selected_lesions:
-            # Define evolution pattern for this lesion
-            evolution_type = random.choice(['growing', 'shrinking', 'stable', 'fluctuating'])
-            initial_size = round(random.uniform(0.5, 3.0), 2)
+        for row, lesion_index in enumerate(lesion_indices):
+            lesion_id = self.lesion_types[lesion_index]
+            evolution_type = evolution_types[row]
             
             for i, exam_date in enumerate(exam_dates):
-                size = self._calculate_lesion_size(initial_size, i, evolution_type, num_exams)
-                
                 # Some lesions may disappear after treatment
-                if evolution_type == 'shrinking' and i > num_exams // 2 and random.random() < 0.3:
+                if evolution_type == 'shrinking' and i > num_exams // 2 and disappears[row, i]:
                     continue
                 
                 # Add treatment context
                 treatments = []
                 if i == num_exams // 3:  # Treatment starts after some exams
-                    treatments = random.choice(self.treatments)
+                    treatments = self.treatments[treatment_indices[row]]
                 
                 data_point = {
                     'lesao_id': lesion_id,
                     'data_exame': exam_date,
-                    'tamanho_cm': size,
+                    'tamanho_cm': float(sizes[row, i]),
                     'tratamentos': treatments,
                     'source_file': f'laudo_sintetico_{i+1}.pdf'
                 }
@@ -65,41 +69,45 @@ class SyntheticDataGenerator:
         
         return all_data
     
-    def _calculate_lesion_size(self, initial_size: float, exam_index: int, 
-                              evolution_type: str, total_exams: int) -> float:
-        """Calculate lesion size based on evolution pattern"""
+    def _calculate_lesion_sizes(self, initial_sizes: np.ndarray, evolution_types: np.ndarray, 
+                                total_exams: int, rng: np.random.Generator) -> np.ndarray:
+        """Calculate sizes of shape (lesions, exams) based on each lesion's evolution pattern"""
+        shape = (len(initial_sizes), total_exams)
+        exam_index = np.arange(total_exams)[None, :]
+        initial = initial_sizes[:, None]
+        treatment_start = total_exams // 3
         
-        if evolution_type == 'growing':
-            # Progressive growth with some variation
-            growth_rate = random.uniform(0.1, 0.3)
-            size = initial_size * (1 + growth_rate * exam_index)
-            
-        elif evolution_type == 'shrinking':
-            # Progressive shrinkage, especially after treatment
-            if exam_index < total_exams // 3:
-                size = initial_size * random.uniform(0.95, 1.05)  # Stable initially
-            else:
-                shrink_rate = random.uniform(0.15, 0.4)
-                size = initial_size * (1 - shrink_rate * (exam_index - total_exams // 3))
-                
-        elif evolution_type == 'stable':
-            # Minimal variation around initial size
-            variation = random.uniform(0.85, 1.15)
-            size = initial_size * variation
-            
-        else:  # fluctuating
-            # Random fluctuations
-            if exam_index == 0:
-                size = initial_size
-            else:
-                change = random.uniform(-0.3, 0.3)
-                size = max(0.2, initial_size * (1 + change * exam_index / total_exams))
+        # Progressive growth with some variation
+        growing = initial * (1 + rng.uniform(0.1, 0.3, shape) * exam_index)
+        
+        # Stable initially, then progressive shrinkage after treatment
+        shrinking = np.where(
+            exam_index < treatment_start,
+            initial * rng.uniform(0.95, 1.05, shape),
+            initial * (1 - rng.uniform(0.15, 0.4, shape) * (exam_index - treatment_start))
+        )
+        
+        # Minimal variation around initial size
+        stable = initial * rng.uniform(0.85, 1.15, shape)
+        
+        # Random fluctuations
+        fluctuating = np.where(
+            exam_index == 0,
+            initial,
+            np.maximum(0.2, initial * (1 + rng.uniform(-0.3, 0.3, shape) * exam_index / total_exams))
+        )
+        
+        types = np.broadcast_to(evolution_types[:, None], shape)
+        sizes = np.select(
+            [types == 'growing', types == 'shrinking', types == 'stable'],
+            [growing, shrinking, stable],
+            default=fluctuating
+        )
         
         # Add some random noise
-        noise = random.uniform(0.95, 1.05)
-        size = max(0.1, size * noise)
+        sizes = np.maximum(0.1, sizes * rng.uniform(0.95, 1.05, shape))
         
-        return round(size, 2)
+        return np.round(sizes, 2)
     
     def generate_demo_button_data(self) -> List[Dict]:
         """Generate quick demo data for button"""
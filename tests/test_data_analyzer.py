@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from data_analyzer import DataAnalyzer
+
+
+def _sample_lesions(rng: np.random.Generator) -> pd.DataFrame:
+    """Random multi-lesion history, with some surgical treatments and repeated sizes"""
+    rows = []
+    for lesion in range(rng.integers(1, 6)):
+        dates = pd.to_datetime('2024-01-01') + pd.to_timedelta(
+            np.sort(rng.choice(720, size=rng.integers(1, 6), replace=False)), unit='D'
+        )
+        base = rng.choice([0.0, 0.5, 1.0, 2.0, 3.5])
+        for date in dates:
+            rows.append({
+                'lesao_id': f'Lesão {lesion}',
+                'data_exame': date,
+                'tamanho_cm': round(max(0.0, base + rng.normal(0, 0.8)), 1),
+                'tratamentos': list(rng.choice(['Cirurgia', 'Quimioterapia', 'Radioterapia'],
+                                               size=rng.integers(0, 2)))
+            })
+    return pd.DataFrame(rows)
+
+
+def test_vectorized_status_matches_per_lesion_status():
+    analyzer = DataAnalyzer()
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        df = analyzer._prepare_dataframe(_sample_lesions(rng))
+        summary = analyzer._summarize_lesions(df)
+        expected = [
+            analyzer._analyze_single_lesion(lesion_data)['Status Atual']
+            for _, lesion_data in df.groupby('lesao_id', sort=False, observed=True)
+        ]
+        assert list(summary['Status Atual']) == expected
+
+
+def test_same_date_exams_compare_with_previous_date():
+    analyzer = DataAnalyzer()
+    df = analyzer._prepare_dataframe(pd.DataFrame({
+        'lesao_id': ['A', 'A', 'A', 'A', 'B'],
+        'data_exame': ['2024-01-01', '2024-02-01', '2024-02-01', '2024-03-01', '2024-02-01'],
+        'tamanho_cm': [2.0, 3.0, 1.0, 4.0, 5.0],
+        'tratamentos': [[], [], [], [], []]
+    }))
+    detailed = analyzer._create_detailed_timeline(df)
+    lesion_a = detailed[detailed['lesao_id'] == 'A']
+    # Both February exams are compared with January; March with the last February exam
+    np.testing.assert_allclose(lesion_a['variacao_absoluta'], [np.nan, 1.0, -1.0, 3.0])
+    assert detailed.loc[detailed['lesao_id'] == 'B', 'variacao_absoluta'].isna().all()
+
+
+def test_non_iso_exam_dates_are_parsed_leniently():
+    analyzer = DataAnalyzer()
+    df = analyzer._prepare_dataframe(pd.DataFrame({
+        'lesao_id': ['A', 'A', 'A', 'A'],
+        'data_exame': ['2024-01-10', '14/03/2024', 'N/A', 'não encontrada'],
+        'tamanho_cm': [2.0, 3.0, 4.0, 5.0]
+    }))
+    # Unreadable dates drop only their own rows
+    assert list(df['data_exame']) == [pd.Timestamp('2024-01-10'), pd.Timestamp('2024-03-14')]
+
+
+def test_float32_sizes_at_the_variation_threshold_stay_stable():
+    # +10% exactly: float32 arithmetic would read 10.000001% and report growth
+    df = pd.DataFrame({
+        'lesao_id': ['A', 'A'],
+        'data_exame': pd.to_datetime(['2024-01-01', '2024-02-01']),
+        'tamanho_cm': np.array([1.10, 1.21], dtype=np.float32)
+    })
+    summary = DataAnalyzer().analyze_lesion_evolution(df)['summary_table']
+    assert summary['Status Atual'].iloc[0] == 'Estável (+10.0%)'
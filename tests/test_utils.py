@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from utils import (create_csv_download, parse_exam_dates, parse_portuguese_date,
+                   parse_portuguese_dates, standardize_units)
+
+
+def test_portuguese_dates_without_any_match_become_nat():
+    parsed = parse_portuguese_dates(pd.Series(['N/A', '', 'não encontrada']))
+    assert parsed.isna().all()
+    assert parse_portuguese_date('abc') is None
+
+
+def test_portuguese_dates_mixed_formats():
+    parsed = parse_portuguese_dates(pd.Series(['5 de março de 2023', '14/03/2024', '2024/3/5', 'abc']))
+    assert list(parsed[:3]) == [pd.Timestamp('2023-03-05'), pd.Timestamp('2024-03-14'), pd.Timestamp('2024-03-05')]
+    assert pd.isna(parsed[3])
+
+
+def test_exam_dates_with_unreadable_values():
+    parsed = parse_exam_dates(['2024-01-01', 'N/A', '', None, '14/03/2024'])
+    assert parsed[0] == pd.Timestamp('2024-01-01') and parsed[4] == pd.Timestamp('2024-03-14')
+    assert parsed[1:4].isna().all()
+
+
+def test_standardize_units_divides_millimeters_by_ten():
+    # Division and Python rounding, as entered: 0.015 -> 0.01 and 0.025 -> 0.03
+    assert standardize_units('0,15', 'mm') == 0.01
+    assert standardize_units('0,25', 'mm') == 0.03
+    assert standardize_units('1,5', 'm') == 150.0
+    assert standardize_units('2,3', 'polegadas') == 2.3
+    assert standardize_units('abc', 'cm') is None
+
+
+def test_csv_download_matches_to_csv():
+    rng = np.random.default_rng(0)
+    frames = [
+        pd.DataFrame({
+            'lesao_id': pd.Categorical(['Lesão A', 'Nódulo B', 'Lesão A']),
+            'data_exame': pd.to_datetime(['2024-01-02', '2024-02-03', None]),
+            'tamanho_cm': np.array([1.1, 13.0, np.nan], dtype=np.float32),
+            'medicoes': [1, 2, 3],
+            'source_file': ['laudo 1.pdf', None, '']
+        }),
+        pd.DataFrame({'x': 10.0 ** rng.uniform(-10, 25, 200), 'y': rng.random(200)}),
+        pd.DataFrame({'nome': ['com, vírgula', 'com "aspas"'], 'valor': [1.5, 2.0]}),
+        pd.DataFrame({'data': pd.to_datetime(['2024-01-02 10:30']), 'ativo': [True]}),
+        pd.DataFrame({'lesao_id': ['A'], 'tratamentos': [['Cirurgia']]}),
+    ]
+    for df in frames:
+        assert create_csv_download(df) == df.to_csv(index=False)
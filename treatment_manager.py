@@ -1,8 +1,68 @@
+import uuid
+import hashlib
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from typing import List, Dict, Optional
 import streamlit as st
 
+def active_treatment_periods() -> List[Dict]:
+    """Registered treatments, skipping deleted (tombstoned) entries"""
+    return [t for t in st.session_state.get('treatment_periods', []) if not t.get('deleted')]
+
+def _treatment_frame(treatments: List[Dict]) -> pd.DataFrame:
+    """Columnar, typed view of treatment period dicts; end is NaT while open-ended"""
+    raw = pd.DataFrame(treatments, columns=[
+        'id', 'tipo', 'medicamento', 'data_inicio', 'data_fim',
+        'dosagem', 'observacoes', 'ativo', 'deleted'
+    ])
+    return pd.DataFrame({
+        'id': raw['id'].astype(object),
+        'tipo': raw['tipo'].astype(object),
+        'medicamento': raw['medicamento'].fillna('').astype(object),
+        'start': pd.to_datetime(raw['data_inicio']),
+        'end': pd.to_datetime(raw['data_fim']),
+        'dosagem': raw['dosagem'].astype(object),
+        'observacoes': raw['observacoes'].astype(object),
+        'ativo': raw['ativo'].eq(True),
+        'deleted': raw['deleted'].eq(True)
+    })
+
+def _content_hash(df: pd.DataFrame) -> bytes:
+    """Content digest of a DataFrame, used as a cheap cache key"""
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    except TypeError:
+        # List-valued columns (tratamentos) are hashed by their string form
+        objects = df.select_dtypes(include='object').columns
+        row_hashes = pd.util.hash_pandas_object(
+            df.assign(**{column: df[column].astype(str) for column in objects}), index=True
+        ).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).digest()
+
+@st.cache_data(show_spinner=False)
+def _correlate(data_hash: bytes, _df: pd.DataFrame, starts: np.ndarray, ends: np.ndarray, labels: tuple, today: str) -> pd.DataFrame:
+    """Tag each exam with the treatments active on its date; cached on the frame's content hash"""
+    # Open-ended treatments run until today
+    ends = np.where(np.isnat(ends), np.datetime64(today, 'D'), ends)
+    exams = pd.to_datetime(_df['data_exame']).to_numpy().astype('datetime64[D]')
+    
+    # Only treatments started on or before an exam can be active, so each exam
+    # checks end dates over a prefix of the start-sorted treatments
+    order = np.argsort(starts, kind='stable')
+    sorted_ends = ends[order]
+    started = np.searchsorted(starts[order], exams, side='right')
+    labels = np.array(labels, dtype=object)
+    
+    periods = []
+    for exam, k in zip(exams, started):
+        # Back to registration order for the label
+        active = np.sort(order[:k][sorted_ends[:k] >= exam])
+        periods.append("; ".join(labels[active]))
+    
+    # assign adds the column without an explicit full copy of the frame
+    return _df.assign(tratamentos_periodo=np.array(periods, dtype=object))
+
 class TreatmentManager:
     """Manages treatment periods and correlates them with lesion evolution"""
     
@@ -83,7 +143,7 @@ class TreatmentManager:
                 )
         
         # Display existing treatments
-        if st.session_state.treatment_periods:
+        if active_treatment_periods():
             st.subheader("📋 Tratamentos Registrados")
             self.display_treatment_list()
     
@@ -91,18 +151,26 @@ class TreatmentManager:
                            start_date, end_date, dosage: str, notes: str):
         """Add a new treatment period"""
         try:
+            today = datetime.now().date()
             treatment = {
-                "id": len(st.session_state.treatment_periods) + 1,
+                "id": uuid.uuid4().hex,
                 "tipo": treatment_type,
                 "medicamento": medication,
                 "data_inicio": start_date.strftime('%Y-%m-%d') if start_date else None,
                 "data_fim": end_date.strftime('%Y-%m-%d') if end_date else None,
                 "dosagem": dosage,
                 "observacoes": notes,
-                "ativo": end_date is None or end_date >= datetime.now().date()
+                "ativo": end_date is None or end_date >= today
             }
             
+            # Keep the columnar frame in step with the list
+            frame = self._treatment_frame()
+            new_row = _treatment_frame([treatment])
             st.session_state.treatment_periods.append(treatment)
+            st.session_state.treatment_periods_df = (
+                new_row if frame.empty else pd.concat([frame, new_row], ignore_index=True)
+            )
+            
             st.success(f"Tratamento {treatment_type} adicionado com sucesso!")
             st.rerun()
             
@@ -112,6 +180,9 @@ class TreatmentManager:
     def display_treatment_list(self):
         """Display list of registered treatments"""
         for i, treatment in enumerate(st.session_state.treatment_periods):
+            if treatment.get('deleted'):
+                continue
+            
             with st.container():
                 col1, col2, col3 = st.columns([3, 1, 1])
                 
@@ -147,9 +218,14 @@ class TreatmentManager:
         st.info("Funcionalidade de edição será implementada em breve")
     
     def delete_treatment(self, index: int):
-        """Delete treatment"""
+        """Delete treatment
+        
+        The entry is tombstoned rather than removed, so list indices and ids stay stable.
+        """
         try:
-            del st.session_state.treatment_periods[index]
+            frame = self._treatment_frame()
+            st.session_state.treatment_periods[index]['deleted'] = True
+            frame.loc[index, 'deleted'] = True
             st.success("Tratamento removido com sucesso!")
             st.rerun()
         except Exception as e:
@@ -157,37 +233,56 @@ class TreatmentManager:
     
     def correlate_treatments_with_lesions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Correlate treatment periods with lesion measurements"""
-        if not st.session_state.get('treatment_periods'):
+        if not active_treatment_periods():
             return df
         
-        df_with_treatments = df.copy()
-        df_with_treatments['tratamentos_periodo'] = ""
+        treatments = self._treatment_frame()
+        treatments = treatments[~treatments['deleted']]
+        medications = treatments['medicamento']
+        labels = np.where(
+            medications != '',
+            treatments['tipo'] + ' (' + medications + ')',
+            treatments['tipo']
+        )
         
-        for index, row in df_with_treatments.iterrows():
-            exam_date = pd.to_datetime(row['data_exame']).date()
-            active_treatments = []
-            
-            for treatment in st.session_state.treatment_periods:
-                start_date = pd.to_datetime(treatment['data_inicio']).date()
-                end_date = pd.to_datetime(treatment['data_fim']).date() if treatment['data_fim'] else datetime.now().date()
-                
-                if start_date <= exam_date <= end_date:
-                    treatment_info = f"{treatment['tipo']}"
-                    if treatment['medicamento']:
-                        treatment_info += f" ({treatment['medicamento']})"
-                    active_treatments.append(treatment_info)
-            
-            df_with_treatments.at[index, 'tratamentos_periodo'] = "; ".join(active_treatments)
+        # Today is part of the key so open-ended treatments are re-evaluated each day
+        return _correlate(
+            _content_hash(df),
+            df,
+            treatments['start'].to_numpy().astype('datetime64[D]'),
+            treatments['end'].to_numpy().astype('datetime64[D]'),
+            tuple(labels),
+            datetime.now().date().isoformat()
+        )
+    
+    def _treatment_frame(self) -> pd.DataFrame:
+        """Columnar treatment frame kept in session state alongside treatment_periods
         
-        return df_with_treatments
+        add_treatment_period and delete_treatment keep it in step; it is rebuilt from
+        the raw list only when missing or when its ids or deleted flags disagree with
+        the list (e.g. session state restored from elsewhere).
+        """
+        treatments = st.session_state.get('treatment_periods', [])
+        frame = st.session_state.get('treatment_periods_df')
+        if frame is None or not self._frame_matches(frame, treatments):
+            frame = _treatment_frame(treatments)
+            st.session_state.treatment_periods_df = frame
+        return frame
+    
+    @staticmethod
+    def _frame_matches(frame: pd.DataFrame, treatments: List[Dict]) -> bool:
+        """Whether the frame holds the same (id, deleted) sequence as the list"""
+        if len(frame) != len(treatments):
+            return False
+        return (
+            list(zip(frame['id'], frame['deleted']))
+            == [(t.get('id'), bool(t.get('deleted'))) for t in treatments]
+        )
     
     def get_treatment_timeline(self) -> List[Dict]:
         """Get timeline of treatments for visualization"""
-        if not st.session_state.get('treatment_periods'):
-            return []
-        
         timeline = []
-        for treatment in st.session_state.treatment_periods:
+        for treatment in active_treatment_periods():
             timeline.append({
                 "nome": f"{treatment['tipo']} - {treatment['medicamento']}",
                 "inicio": treatment['data_inicio'],
@@ -200,6 +295,6 @@ class TreatmentManager:
     def export_treatments_to_dict(self) -> Dict:
         """Export treatments for analysis storage"""
         return {
-            "treatment_periods": st.session_state.get('treatment_periods', []),
+            "treatment_periods": active_treatment_periods(),
             "export_timestamp": datetime.now().isoformat()
         }
\ No newline at end of file
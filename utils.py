@@ -1,9 +1,51 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Union
 import re
 from datetime import datetime
+from functools import lru_cache
 import io
+import gzip
+import base64
+import orjson
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # optional: CSV export falls back to pandas to_csv
+    pa = None
+try:
+    import zstandard
+except ImportError:  # optional: compressed CSV export falls back to gzip
+    zstandard = None
+
+# Patterns compiled once at import time
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s\.,:/\-()]')
+_NUMERIC_RE = re.compile(r'(\d+[,\.]\d+|\d+)')
+_FILENAME_RE = re.compile(r'[^\w\-_\.]')
+
+# Portuguese date patterns, in order of precedence
+_PT_NAMED_DATE_PATTERN = r'(\d{1,2})\s*de\s*(\w+)\s*de\s*(\d{4})'
+_PT_DMY_DATE_PATTERN = r'(\d{1,2})([/-])(\d{1,2})\2(\d{4})'
+_PT_YMD_DATE_PATTERN = r'(\d{4})([/-])(\d{1,2})\2(\d{1,2})'
+_PT_NAMED_DATE_RE = re.compile(_PT_NAMED_DATE_PATTERN)
+_PT_DMY_DATE_RE = re.compile(_PT_DMY_DATE_PATTERN)
+_PT_YMD_DATE_RE = re.compile(_PT_YMD_DATE_PATTERN)
+
+# Conversion to centimeters as (multiplier, divisor); unknown units default to cm.
+# Millimeters divide by 10 rather than multiply by 0.1, which rounds differently
+_UNIT_FACTOR = {
+    'mm': (1.0, 10.0), 'milímetro': (1.0, 10.0), 'milímetros': (1.0, 10.0),
+    'cm': (1.0, 1.0), 'centímetro': (1.0, 1.0), 'centímetros': (1.0, 1.0),
+    'm': (100.0, 1.0), 'metro': (100.0, 1.0), 'metros': (100.0, 1.0)
+}
+
+# Portuguese month names
+_PT_MONTH_NAMES = {
+    'janeiro': '01', 'fevereiro': '02', 'março': '03', 'abril': '04',
+    'maio': '05', 'junho': '06', 'julho': '07', 'agosto': '08',
+    'setembro': '09', 'outubro': '10', 'novembro': '11', 'dezembro': '12'
+}
 
 def format_summary_table(summary_df: pd.DataFrame) -> str:
     """Convert summary DataFrame to Markdown format"""
@@ -19,18 +61,18 @@ def format_summary_table(summary_df: pd.DataFrame) -> str:
     markdown_lines.append("| " + " | ".join(headers) + " |")
     markdown_lines.append("|" + "|".join(["-------"] * len(headers)) + "|")
     
-    # Data rows
-    for _, row in summary_df.iterrows():
-        row_data = [
-            str(row['Lesão']),
-            str(row['Primeira Data']),
-            f"{row['Tamanho Inicial (cm)']:.2f}",
-            str(row['Última Data']),
-            f"{row['Tamanho Final (cm)']:.2f}",
-            f"{row['Variação Total (%)']:+.1f}%",
-            str(row['Status Atual'])
-        ]
-        markdown_lines.append("| " + " | ".join(row_data) + " |")
+    # Data rows, built column-wise
+    rows = (
+        "| " + summary_df['Lesão'].astype(str)
+        + " | " + summary_df['Primeira Data'].astype(str)
+        + " | " + summary_df['Tamanho Inicial (cm)'].map('{:.2f}'.format)
+        + " | " + summary_df['Última Data'].astype(str)
+        + " | " + summary_df['Tamanho Final (cm)'].map('{:.2f}'.format)
+        + " | " + summary_df['Variação Total (%)'].map('{:+.1f}%'.format)
+        + " | " + summary_df['Status Atual'].astype(str)
+        + " |"
+    )
+    markdown_lines.extend(rows.tolist())
     
     return "\n".join(markdown_lines)
 
@@ -47,17 +89,17 @@ def format_detailed_table(detailed_df: pd.DataFrame) -> str:
     markdown_lines.append("| " + " | ".join(headers) + " |")
     markdown_lines.append("|" + "|".join(["-------"] * len(headers)) + "|")
     
-    # Data rows
-    for _, row in detailed_df.iterrows():
-        variation_str = f"{row['variacao_percentual']:+.1f}%" if pd.notna(row['variacao_percentual']) else "Primeira medição"
-        
-        row_data = [
-            str(row['lesao_id']),
-            row['data_exame'].strftime('%d/%m/%Y'),
-            f"{row['tamanho_cm']:.2f}",
-            variation_str
-        ]
-        markdown_lines.append("| " + " | ".join(row_data) + " |")
+    # Data rows, built column-wise
+    variations = detailed_df['variacao_percentual']
+    variation_str = variations.map('{:+.1f}%'.format).where(variations.notna(), "Primeira medição")
+    rows = (
+        "| " + detailed_df['lesao_id'].astype(str)
+        + " | " + detailed_df['data_exame'].dt.strftime('%d/%m/%Y')
+        + " | " + detailed_df['tamanho_cm'].map('{:.2f}'.format)
+        + " | " + variation_str
+        + " |"
+    )
+    markdown_lines.extend(rows.tolist())
     
     return "\n".join(markdown_lines)
 
@@ -89,21 +131,23 @@ def validate_dataframe(df: pd.DataFrame, required_columns: List[str]) -> Dict[st
             validation_results['warnings'].append(f"{null_lesions} registros com lesao_id nulo")
     
     if 'tamanho_cm' in df.columns:
+        sizes = df['tamanho_cm'].to_numpy()
+        
         # Check for negative or zero sizes
-        invalid_sizes = df[df['tamanho_cm'] <= 0].shape[0]
+        invalid_sizes = int((sizes <= 0).sum())
         if invalid_sizes > 0:
             validation_results['warnings'].append(f"{invalid_sizes} registros com tamanho inválido (≤0)")
         
         # Check for extremely large sizes (>50cm)
-        large_sizes = df[df['tamanho_cm'] > 50].shape[0]
+        large_sizes = int((sizes > 50).sum())
         if large_sizes > 0:
             validation_results['warnings'].append(f"{large_sizes} registros com tamanho muito grande (>50cm)")
     
+    parsed_dates = None
     if 'data_exame' in df.columns:
-        # Check date format
-        try:
-            pd.to_datetime(df['data_exame'])
-        except:
+        # Check date format, parsing once and reusing the result for the summary
+        parsed_dates = pd.to_datetime(df['data_exame'], errors='coerce')
+        if (parsed_dates.isna() & df['data_exame'].notna()).any():
             validation_results['is_valid'] = False
             validation_results['errors'].append("Formato de data inválido na coluna data_exame")
     
@@ -111,18 +155,20 @@ def validate_dataframe(df: pd.DataFrame, required_columns: List[str]) -> Dict[st
     validation_results['summary'] = {
         'total_records': len(df),
         'unique_lesions': df['lesao_id'].nunique() if 'lesao_id' in df.columns else 0,
-        'date_range': get_date_range_summary(df) if 'data_exame' in df.columns else None
+        'date_range': get_date_range_summary(parsed_dates) if parsed_dates is not None else None
     }
     
     return validation_results
 
-def get_date_range_summary(df: pd.DataFrame) -> Dict[str, str]:
-    """Get summary of date range in DataFrame"""
-    if 'data_exame' not in df.columns or df.empty:
-        return {'start': None, 'end': None, 'span_days': 0}
+def get_date_range_summary(data: Union[pd.DataFrame, pd.Series]) -> Dict[str, str]:
+    """Get summary of date range in DataFrame or in an already parsed date Series"""
+    if isinstance(data, pd.DataFrame):
+        if 'data_exame' not in data.columns or data.empty:
+            return {'start': None, 'end': None, 'span_days': 0}
+        data = data['data_exame']
     
     try:
-        dates = pd.to_datetime(df['data_exame'])
+        dates = data if pd.api.types.is_datetime64_any_dtype(data) else pd.to_datetime(data)
         start_date = dates.min()
         end_date = dates.max()
         span_days = (end_date - start_date).days
@@ -141,32 +187,27 @@ def clean_text(text: str) -> str:
         return ""
     
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text.strip())
+    text = _WHITESPACE_RE.sub(' ', text.strip())
     
     # Remove special characters that might interfere with parsing
-    text = re.sub(r'[^\w\s\.,:/\-()]', '', text)
+    text = _SPECIAL_CHARS_RE.sub('', text)
     
     return text
 
+def standardize_units_series(sizes: pd.Series, units: pd.Series) -> pd.Series:
+    """Standardize a column of measurements to centimeters"""
+    values = pd.to_numeric(sizes.astype(str).str.replace(',', '.', regex=False).str.strip(), errors='coerce')
+    unit_keys = units.astype(str).str.lower().str.strip()
+    multipliers = unit_keys.map({unit: factor[0] for unit, factor in _UNIT_FACTOR.items()}).fillna(1.0)
+    divisors = unit_keys.map({unit: factor[1] for unit, factor in _UNIT_FACTOR.items()}).fillna(1.0)
+    return (values * multipliers.to_numpy() / divisors.to_numpy()).round(2)
+
 def standardize_units(size_str: str, unit_str: str) -> Optional[float]:
     """Standardize measurement units to centimeters"""
     try:
-        # Clean size string
-        size_str = size_str.replace(',', '.').strip()
-        size_value = float(size_str)
-        
-        # Convert based on unit
-        unit_lower = unit_str.lower().strip()
-        
-        if unit_lower in ['mm', 'milímetro', 'milímetros']:
-            return round(size_value / 10, 2)
-        elif unit_lower in ['cm', 'centímetro', 'centímetros']:
-            return round(size_value, 2)
-        elif unit_lower in ['m', 'metro', 'metros']:
-            return round(size_value * 100, 2)
-        else:
-            # Default to cm if unit is unclear
-            return round(size_value, 2)
+        size_value = float(size_str.replace(',', '.').strip())
+        multiplier, divisor = _UNIT_FACTOR.get(unit_str.lower().strip(), (1.0, 1.0))
+        return round(size_value * multiplier / divisor, 2)
     
     except (ValueError, TypeError):
         return None
@@ -182,44 +223,53 @@ def calculate_percentage_change(old_value: float, new_value: float) -> Optional[
     except (TypeError, ZeroDivisionError):
         return None
 
-def detect_outliers(values: List[float], method: str = 'iqr') -> List[bool]:
+def pct_change_series(values) -> pd.Series:
+    """Percentage change between consecutive values; NaN where the previous value is zero"""
+    values = pd.Series(values, dtype='float64')
+    prev = values.shift(1)
+    change = (values - prev) / prev.where(prev != 0) * 100.0
+    return change.round(2)
+
+def detect_outliers(values: List[float], method: str = 'iqr') -> np.ndarray:
     """Detect outliers in a list of values"""
-    if not values or len(values) < 4:
-        return [False] * len(values)
+    arr = np.asarray(values, dtype=np.float64)
+    no_outliers = np.zeros(arr.shape, dtype=bool)
+    if arr.size < 4:
+        return no_outliers
     
     try:
         if method == 'iqr':
             # Interquartile Range method
-            q1 = np.percentile(values, 25)
-            q3 = np.percentile(values, 75)
+            q1, q3 = np.percentile(arr, [25, 75])
             iqr = q3 - q1
             
-            lower_bound = q1 - 1.5 * iqr
-            upper_bound = q3 + 1.5 * iqr
-            
-            return [v < lower_bound or v > upper_bound for v in values]
+            return (arr < q1 - 1.5 * iqr) | (arr > q3 + 1.5 * iqr)
         
         elif method == 'zscore':
             # Z-score method
-            mean_val = np.mean(values)
-            std_val = np.std(values)
+            mean_val = arr.mean()
+            std_val = arr.std()
             
             if std_val == 0:
-                return [False] * len(values)
+                return no_outliers
             
-            z_scores = [(v - mean_val) / std_val for v in values]
-            return [abs(z) > 3 for z in z_scores]
+            return np.abs(arr - mean_val) > 3 * std_val
         
         else:
-            return [False] * len(values)
+            return no_outliers
     
     except Exception:
-        return [False] * len(values)
+        return no_outliers
+
+@lru_cache(maxsize=256)
+def _clean_filename_base(base_name: str) -> str:
+    """Replace characters not allowed in file names (cached per base name)"""
+    return _FILENAME_RE.sub('_', base_name)
 
 def generate_filename(base_name: str, extension: str, timestamp: bool = True) -> str:
     """Generate standardized filename"""
     # Clean base name
-    base_name = re.sub(r'[^\w\-_\.]', '_', base_name)
+    base_name = _clean_filename_base(base_name)
     
     # Add timestamp if requested
     if timestamp:
@@ -231,18 +281,92 @@ def generate_filename(base_name: str, extension: str, timestamp: bool = True) ->
     
     return filename
 
+def _arrow_csv_frame(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """Frame for the Arrow CSV writer, or None when its output would differ from to_csv
+    
+    Only integer, float, string and date-only datetime columns qualify. Floats and
+    dates are pre-formatted the way to_csv writes them: Arrow prints floats
+    differently (1e-7, 13 for 13.0) and datetimes with their time.
+    """
+    # A single-column row that is entirely missing is written as "" by pandas
+    if df.empty or len(df.columns) < 2:
+        return None
+    
+    formatted = {}
+    for column, values in df.items():
+        # Header names are written unquoted, so they must not need quoting
+        if not isinstance(column, str) or any(char in column for char in ',"\r\n'):
+            return None
+        
+        dtype = values.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            # Arrow writes true/false where pandas writes True/False
+            return None
+        if isinstance(dtype, pd.CategoricalDtype):
+            if pd.api.types.infer_dtype(dtype.categories, skipna=True) != 'string':
+                return None
+        elif isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+            continue
+        elif isinstance(dtype, np.dtype) and dtype.kind == 'f':
+            # NumPy's shortest repr matches to_csv, also for float32; NaN stays empty
+            numbers = values.to_numpy()
+            formatted[column] = np.where(np.isnan(numbers), None, numbers.astype(str))
+        elif isinstance(dtype, np.dtype) and dtype.kind == 'M':
+            present = values.dropna()
+            if not (present == present.dt.normalize()).all():
+                return None
+            formatted[column] = values.dt.strftime('%Y-%m-%d')
+        elif pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            return None
+    
+    return df.assign(**formatted) if formatted else df
+
 def create_csv_download(df: pd.DataFrame, filename: str = None) -> str:
     """Create CSV string for download"""
     if filename is None:
         filename = generate_filename("dados_lesoes", "csv")
     
-    # Convert DataFrame to CSV string
+    # Convert DataFrame to CSV string with the multi-threaded Arrow writer when its
+    # output is byte-identical to pandas, otherwise through to_csv
+    arrow_df = _arrow_csv_frame(df) if pa is not None else None
+    if arrow_df is not None:
+        try:
+            table = pa.Table.from_pandas(arrow_df, preserve_index=False)
+            buffer = pa.BufferOutputStream()
+            # Unquoted like to_csv; values that would need quotes raise and fall back
+            pacsv.write_csv(table, buffer, pacsv.WriteOptions(include_header=False, quoting_style='none'))
+            header = ','.join(arrow_df.columns) + '\n'
+            return header + buffer.getvalue().to_pybytes().decode('utf-8')
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            # Columns Arrow cannot write as CSV (e.g. lists) go through pandas
+            pass
+    
     csv_buffer = io.StringIO()
     df.to_csv(csv_buffer, index=False, encoding='utf-8')
     csv_string = csv_buffer.getvalue()
     
     return csv_string
 
+def create_compressed_csv_download(df: pd.DataFrame, filename: str = None) -> Tuple[bytes, str]:
+    """Create compressed CSV bytes for download, returning the data and its file name
+    
+    Uses zstd level 3 when zstandard is installed, gzip otherwise.
+    """
+    csv_bytes = create_csv_download(df).encode('utf-8')
+    
+    if zstandard is not None:
+        data = zstandard.ZstdCompressor(level=3).compress(csv_bytes)
+        extension = "csv.zst"
+    else:
+        data = gzip.compress(csv_bytes, compresslevel=6)
+        extension = "csv.gz"
+    
+    if filename is None:
+        filename = generate_filename("dados_lesoes", extension)
+    
+    return data, filename
+
+@lru_cache(maxsize=1024)
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
     if size_bytes == 0:
@@ -256,45 +380,68 @@ def format_file_size(size_bytes: int) -> str:
     
     return f"{size_bytes:.1f} {size_names[i]}"
 
+def parse_portuguese_dates(dates: pd.Series) -> pd.Series:
+    """Parse a Series of Portuguese date strings; unparseable entries become NaT"""
+    text = dates.astype(object).str.lower()
+    named = text.str.extract(_PT_NAMED_DATE_PATTERN)
+    dmy = text.str.extract(_PT_DMY_DATE_PATTERN)
+    ymd = text.str.extract(_PT_YMD_DATE_PATTERN)
+    
+    # "day de month de year" wins when the month name is known, then d/m/Y, then Y/m/d
+    month_num = named[1].map(_PT_MONTH_NAMES)
+    has_named = month_num.notna()
+    # One string dtype for every part: columns with no match at all come back
+    # with a different dtype, which the concatenation below cannot mix
+    day = named[0].where(has_named, dmy[0]).fillna(ymd[3]).astype('string')
+    month = month_num.where(has_named, dmy[2]).fillna(ymd[2]).astype('string')
+    year = named[2].where(has_named, dmy[3]).fillna(ymd[0]).astype('string')
+    
+    return pd.to_datetime(day + '/' + month + '/' + year, format='%d/%m/%Y', errors='coerce')
+
+def parse_exam_dates(dates) -> pd.Series:
+    """Parse exam dates: ISO 8601 first, then the Portuguese formats; failures become NaT"""
+    dates = pd.Series(dates, dtype=object)
+    parsed = pd.to_datetime(dates, format='ISO8601', errors='coerce', cache=True)
+    
+    # Model output or the regex fallback may ignore the ISO format (e.g. "14/03/2024")
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        parsed[retry] = parse_portuguese_dates(dates[retry].astype(str))
+    return parsed
+
 def parse_portuguese_date(date_str: str) -> Optional[datetime]:
     """Parse Portuguese date formats"""
     if not isinstance(date_str, str):
         return None
     
-    # Common Portuguese date patterns
-    patterns = [
-        (r'(\d{1,2})\s*de\s*(\w+)\s*de\s*(\d{4})', '%d %B %Y'),
-        (r'(\d{1,2})/(\d{1,2})/(\d{4})', '%d/%m/%Y'),
-        (r'(\d{1,2})-(\d{1,2})-(\d{4})', '%d-%m-%Y'),
-        (r'(\d{4})/(\d{1,2})/(\d{1,2})', '%Y/%m/%d'),
-        (r'(\d{4})-(\d{1,2})-(\d{1,2})', '%Y-%m-%d')
-    ]
-    
-    # Portuguese month names
-    month_names = {
-        'janeiro': '01', 'fevereiro': '02', 'março': '03', 'abril': '04',
-        'maio': '05', 'junho': '06', 'julho': '07', 'agosto': '08',
-        'setembro': '09', 'outubro': '10', 'novembro': '11', 'dezembro': '12'
-    }
+    # Scalar path on the compiled patterns; a one-row Series costs ~100x more
+    text = date_str.lower()
     
-    # Try to parse with different patterns
-    for pattern, date_format in patterns:
-        match = re.search(pattern, date_str.lower())
-        if match:
+    match = _PT_NAMED_DATE_RE.search(text)
+    if match:
+        day, month, year = match.groups()
+        month_num = _PT_MONTH_NAMES.get(month)
+        if month_num:
             try:
-                if 'de' in pattern:
-                    # Handle "day de month de year" format
-                    day, month, year = match.groups()
-                    month_num = month_names.get(month.lower())
-                    if month_num:
-                        date_obj = datetime.strptime(f"{day}/{month_num}/{year}", '%d/%m/%Y')
-                        return date_obj
-                else:
-                    # Handle numeric formats
-                    date_obj = datetime.strptime(match.group(), date_format)
-                    return date_obj
+                return datetime(int(year), int(month_num), int(day))
             except ValueError:
-                continue
+                pass
+    
+    match = _PT_DMY_DATE_RE.search(text)
+    if match:
+        day, _, month, year = match.groups()
+        try:
+            return datetime(int(year), int(month), int(day))
+        except ValueError:
+            pass
+    
+    match = _PT_YMD_DATE_RE.search(text)
+    if match:
+        year, _, month, day = match.groups()
+        try:
+            return datetime(int(year), int(month), int(day))
+        except ValueError:
+            pass
     
     return None
 
@@ -312,9 +459,8 @@ def extract_numeric_value(text: str) -> Optional[float]:
     if not isinstance(text, str):
         return None
     
-    # Pattern to match decimal numbers (with comma or dot)
-    pattern = r'(\d+[,\.]\d+|\d+)'
-    match = re.search(pattern, text)
+    # Match decimal numbers (with comma or dot)
+    match = _NUMERIC_RE.search(text)
     
     if match:
         try:
@@ -325,21 +471,35 @@ def extract_numeric_value(text: str) -> Optional[float]:
     
     return None
 
+def _json_default(value: Any) -> Any:
+    """Serialize the pandas objects orjson does not handle natively"""
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if value is pd.NaT:
+        return None
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+def _encode_dataframe(df: pd.DataFrame) -> Any:
+    """Encode a DataFrame for the backup JSON"""
+    if pa is None:
+        return df.to_dict('list')
+    
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine='pyarrow', compression='zstd')
+    return {'__parquet_b64__': base64.b64encode(buffer.getvalue()).decode('ascii')}
+
 def create_backup_data(data: Dict[str, Any], backup_name: str = None) -> str:
     """Create backup of analysis data"""
     if backup_name is None:
         backup_name = generate_filename("backup_analise", "json")
     
     try:
-        import json
-        
-        # Convert pandas objects to serializable format
+        # Embed DataFrames as base64 Parquet (columnar JSON without pyarrow);
+        # everything else is handled by orjson
         serializable_data = {}
         for key, value in data.items():
             if isinstance(value, pd.DataFrame):
-                serializable_data[key] = value.to_dict('records')
-            elif isinstance(value, pd.Timestamp):
-                serializable_data[key] = value.isoformat()
+                serializable_data[key] = _encode_dataframe(value)
             else:
                 serializable_data[key] = value
         
@@ -349,8 +509,24 @@ def create_backup_data(data: Dict[str, Any], backup_name: str = None) -> str:
             'version': '1.0'
         }
         
-        json_string = json.dumps(serializable_data, indent=2, ensure_ascii=False)
-        return json_string
+        json_bytes = orjson.dumps(
+            serializable_data,
+            default=_json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+        return json_bytes.decode('utf-8')
     
     except Exception as e:
         raise Exception(f"Erro ao criar backup: {str(e)}")
+
+def restore_backup_data(json_string: str) -> Dict[str, Any]:
+    """Load a backup created by create_backup_data, decoding embedded DataFrames"""
+    try:
+        data = orjson.loads(json_string)
+        for key, value in data.items():
+            if isinstance(value, dict) and '__parquet_b64__' in value:
+                data[key] = pd.read_parquet(io.BytesIO(base64.b64decode(value['__parquet_b64__'])))
+        return data
+    
+    except Exception as e:
+        raise Exception(f"Erro ao restaurar backup: {str(e)}")
@@ -1,29 +1,222 @@
+import io
+import os
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+# Headless rendering: no GUI backend detection or interactive figure managers
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
+from matplotlib.ticker import FuncFormatter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from typing import List, Optional, Dict
-import seaborn as sns
+from functools import lru_cache
+from typing import List, Optional, Dict, Tuple
+try:
+    from numba import njit
+except ImportError:  # optional: the trend fit runs as plain NumPy
+    njit = None
 
-# Set matplotlib style for medical reports
+# Matplotlib style for medical reports, applied once at import
+_RC = {
+    'figure.facecolor': 'white',
+    'figure.figsize': (12, 8),
+    'font.size': 10,
+    'axes.titlesize': 14,
+    'axes.labelsize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 10,
+    'figure.dpi': 100
+}
 plt.style.use('default')
-sns.set_palette("husl")
-plt.rcParams['figure.facecolor'] = 'white'
+plt.rcParams.update(_RC)
+
+@lru_cache(maxsize=4096)
+def _format_tick_date(x: float) -> str:
+    """dd/mm/yyyy tick label for a matplotlib date number"""
+    return mdates.num2date(x).strftime('%d/%m/%Y')
+
+# Shared x-axis date formatter; it keeps no per-axis state, unlike locators,
+# which read their axis' view limits and so are still created per chart.
+# Month ticks repeat across charts and across the layout and save passes,
+# so each label is formatted once
+_DATE_FORMATTER = FuncFormatter(lambda x, pos=None: _format_tick_date(x))
+
+# Upper bound on monthly x-axis ticks; longer histories tick every few months
+_MAX_MONTH_TICKS = 12
+
+# Points kept per series when plotting; enough for the chart's pixel width
+_MAX_PLOT_POINTS = 2000
+
+# Above this many points only first/last/extreme measurements get value labels
+_MAX_LABELED_POINTS = 30
+
+# Above this many points value labels are drawn without a bbox patch
+_MAX_BOXED_LABEL_POINTS = 10
+
+# Above this many measurements the timeline chart drops its per-point size labels
+_MAX_TIMELINE_LABELS = 300
+
+# Vector exports rasterize line/marker artists with at least this many vertices
+_RASTERIZE_MIN_POINTS = 500
+
+def _artist_points(artist) -> int:
+    """Number of vertices/markers an artist draws"""
+    if isinstance(artist, Line2D):
+        return len(artist.get_xydata())
+    if isinstance(artist, LineCollection):
+        return sum(len(segment) for segment in artist.get_segments())
+    return len(artist.get_offsets())
+
+def _decimate(x: np.ndarray, y: np.ndarray, n_out: int = _MAX_PLOT_POINTS):
+    """Min-max decimation: keep each bucket's extremes plus the first and last points"""
+    n = len(y)
+    if n <= n_out:
+        return x, y
+    
+    keep = [0, n - 1]
+    for bucket in np.array_split(np.arange(n), n_out // 2):
+        values = y[bucket]
+        keep.append(bucket[np.nanargmin(values)] if not np.isnan(values).all() else bucket[0])
+        keep.append(bucket[np.nanargmax(values)] if not np.isnan(values).all() else bucket[-1])
+    
+    keep = np.unique(keep)
+    return x[keep], y[keep]
+
+# Bump when chart styling changes so cached chart images are rebuilt
+_CHART_STYLE_VERSION = 1
+
+# Number of encoded individual chart PNGs kept in memory
+_PNG_CACHE_SIZE = 64
+
+# Cleared figures kept for reuse per generator
+_FIG_POOL_SIZE = 4
+
+def _linfit(x: np.ndarray, y: np.ndarray):
+    """Closed-form least-squares line (slope, intercept); NaNs when x is constant"""
+    # Centering keeps the sums well conditioned for date numbers around 2e4
+    x_mean = x.mean()
+    y_mean = y.mean()
+    dx = x - x_mean
+    denom = (dx * dx).sum()
+    if denom == 0.0:
+        return np.nan, np.nan
+    slope = (dx * (y - y_mean)).sum() / denom
+    return slope, y_mean - slope * x_mean
+
+if njit is not None:
+    _linfit = njit(cache=True)(_linfit)
+
+@lru_cache(maxsize=128)
+def _trend_coefs(date_bytes: bytes, size_bytes: bytes) -> Tuple[float, float]:
+    """Trend line (slope, intercept) for float64 series given as raw bytes"""
+    x = np.frombuffer(date_bytes, dtype=np.float64)
+    y = np.frombuffer(size_bytes, dtype=np.float64)
+    slope, intercept = _linfit(x, y)
+    return float(slope), float(intercept)
+
+def _month_locator(dates: np.ndarray) -> mdates.MonthLocator:
+    """Monthly locator whose interval keeps about _MAX_MONTH_TICKS ticks over the data span"""
+    span_months = int((np.nanmax(dates) - np.nanmin(dates)) // 30) if len(dates) else 0
+    return mdates.MonthLocator(interval=max(1, span_months // _MAX_MONTH_TICKS))
+
+def _ensure_datetime(df: pd.DataFrame) -> pd.DataFrame:
+    """Return ``df`` with a datetime64 data_exame column, converting only when needed"""
+    if pd.api.types.is_datetime64_any_dtype(df['data_exame']):
+        return df
+    # Exam dates repeat across lesions, so the parse cache pays off here
+    return df.assign(data_exame=pd.to_datetime(df['data_exame'], cache=True))
+
+def _frame_digest(df: pd.DataFrame, columns: List[str]) -> str:
+    """Cheap content hash of the columns a chart is drawn from"""
+    hashed = pd.util.hash_pandas_object(df[columns], index=True).to_numpy()
+    return hashlib.blake2b(hashed.tobytes(), digest_size=16).hexdigest()
+
+def _treatment_snapshot(treatments: Optional[List[Dict]]) -> tuple:
+    """Hashable snapshot of the treatment periods drawn as chart backgrounds"""
+    return tuple(tuple(sorted(treatment.items())) for treatment in treatments or [])
+
+# Background colors per treatment type
+_TREATMENT_COLORS = {
+    'Quimioterapia': '#ffcccc',
+    'Radioterapia': '#ccffcc', 
+    'Imunoterapia': '#ccccff',
+    'Terapia Direcionada': '#ffffcc',
+    'Hormonioterapia': '#ffccff',
+    'Cirurgia': '#ccffff',
+    'Outro': '#f0f0f0'
+}
+
+@lru_cache(maxsize=128)
+def _compiled_treatment_periods(snapshot: tuple) -> tuple:
+    """Parsed (start, end, color, label) per live treatment; end is None while ongoing"""
+    treatments = [dict(items) for items in snapshot]
+    treatments = [treatment for treatment in treatments if not treatment.get('deleted')]
+    if not treatments:
+        return ()
+    
+    # One parse per column instead of two scalar to_datetime calls per treatment
+    starts = pd.to_datetime([treatment['data_inicio'] for treatment in treatments], errors='coerce')
+    ends = pd.to_datetime([treatment['data_fim'] or None for treatment in treatments], errors='coerce')
+    
+    periods = []
+    for treatment, start_date, end_date in zip(treatments, starts, ends):
+        # Unparseable dates skip the treatment; an empty end date means ongoing
+        if pd.isna(start_date) or (treatment['data_fim'] and pd.isna(end_date)):
+            continue
+        color = _TREATMENT_COLORS.get(treatment['tipo'], _TREATMENT_COLORS['Outro'])
+        label_text = f"{treatment['tipo']}"
+        if treatment['medicamento']:
+            label_text = f"{treatment['tipo']}\n({treatment['medicamento']})"
+        periods.append((start_date, None if pd.isna(end_date) else end_date, color, label_text))
+    return tuple(periods)
+
+# Bar colors indexed by sign of the variation + 1: decrease, no change, increase
+_VARIATION_PALETTE = np.array(['#2ecc71', '#95a5a6', '#e74c3c'])
+
+def _render_individual_png(job: tuple) -> bytes:
+    """Worker for generate_all (module level so it can be pickled)"""
+    lesion_name, lesion_data, treatments, dpi = job
+    generator = VisualizationGenerator()
+    fig = generator._build_individual_chart(_ensure_datetime(lesion_data), lesion_name, treatments)
+    return generator.to_png_bytes(fig, dpi)
 
 class VisualizationGenerator:
     """Handles chart generation for lesion evolution analysis"""
     
+    # Encoded individual charts shared across instances, in LRU order. Only
+    # immutable bytes are shared: live Figures never leave the generator that built them
+    _chart_png_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+    # Streamlit serves sessions from separate threads that share this cache
+    _chart_png_cache_lock = threading.Lock()
+    
+    # Figure sizes (inches) and resolutions; pixel count drives rendering cost
+    individual_figsize = (12, 8)
+    combined_figsize = (14, 10)
+    variation_figsize = (12, 8)
+    timeline_figsize = (16, 10)
+    empty_figsize = (10, 6)
+    display_dpi = 100
+    # Exports use 150 dpi by default; pass dpi=300 explicitly for print-ready files
+    export_dpi = 150
+    
     def __init__(self):
-        # Configure matplotlib for better display
-        plt.rcParams['figure.figsize'] = (12, 8)
-        plt.rcParams['font.size'] = 10
-        plt.rcParams['axes.titlesize'] = 14
-        plt.rcParams['axes.labelsize'] = 12
-        plt.rcParams['xtick.labelsize'] = 10
-        plt.rcParams['ytick.labelsize'] = 10
-        plt.rcParams['legend.fontsize'] = 10
-        plt.rcParams['figure.dpi'] = 100
+        # Cleared figures available for reuse (see release_chart), per figure size so
+        # a reused canvas keeps its Agg renderer; bounded so a burst of releases does
+        # not keep many large canvases alive
+        self._fig_pool: "Dict[Tuple[float, float], deque[Figure]]" = {}
+        
+        # PNG bytes per figure and dpi; entries go away with their figure
+        self._png_cache: "weakref.WeakKeyDictionary[Figure, Dict[int, bytes]]" = weakref.WeakKeyDictionary()
         
         # Color palette for different lesions
         self.color_palette = [
@@ -31,52 +224,164 @@ class VisualizationGenerator:
             '#1abc9c', '#34495e', '#e67e22', '#95a5a6', '#8e44ad'
         ]
     
-    def create_individual_chart(self, lesion_data: pd.DataFrame, lesion_name: str):
-        """Create individual evolution chart for a single lesion"""
+    def _acquire_fig(self, figsize):
+        """Get a figure and axes from the pool, or create them
+        
+        Figures are built directly on an Agg canvas, outside pyplot's global
+        figure registry, so batch rendering neither leaks figures nor shares state.
+        """
+        pool = self._fig_pool.get(tuple(figsize))
+        if pool:
+            fig = pool.pop()
+            fig.set_dpi(self.display_dpi)
+        else:
+            fig = Figure(figsize=figsize, dpi=self.display_dpi)
+            FigureCanvasAgg(fig)
+        return fig, fig.add_subplot()
+    
+    def release_chart(self, fig: Figure):
+        """Return a figure the caller is done with to the pool for reuse"""
+        # A cleared figure must not be served from the caches
+        self._png_cache.pop(fig, None)
+        
+        fig.clf()
+        figsize = tuple(float(size) for size in fig.get_size_inches())
+        self._fig_pool.setdefault(figsize, deque(maxlen=_FIG_POOL_SIZE)).append(fig)
+    
+    def create_individual_chart(self, lesion_data: pd.DataFrame, lesion_name: str,
+                                treatments: Optional[List[Dict]] = None):
+        """Create individual evolution chart for a single lesion
+        
+        ``treatments`` are the periods shaded in the background. The figure belongs
+        to the caller; create_individual_chart_png memoizes the encoded image instead.
+        """
         
         if lesion_data.empty:
             return self._create_empty_chart(f"Sem dados para {lesion_name}")
         
+        return self._build_individual_chart(_ensure_datetime(lesion_data), lesion_name, treatments)
+    
+    def create_individual_chart_png(self, lesion_data: pd.DataFrame, lesion_name: str,
+                                    treatments: Optional[List[Dict]] = None,
+                                    dpi: Optional[int] = None) -> bytes:
+        """Individual chart as PNG bytes at ``display_dpi``, for static display
+        
+        The bytes are memoized on the lesion, a hash of its data, the treatment
+        periods and the dpi; the figure goes back to the pool, so only the encoded
+        image stays alive.
+        """
+        dpi = dpi or self.display_dpi
+        if lesion_data.empty:
+            return self._render_and_release(self._create_empty_chart(f"Sem dados para {lesion_name}"), dpi)
+        
+        lesion_data = _ensure_datetime(lesion_data)
+        cache_key = (
+            _CHART_STYLE_VERSION,
+            lesion_name,
+            _frame_digest(lesion_data, ['data_exame', 'tamanho_cm']),
+            _treatment_snapshot(treatments),
+            dpi
+        )
+        with self._chart_png_cache_lock:
+            png = self._chart_png_cache.get(cache_key)
+            if png is not None:
+                self._chart_png_cache.move_to_end(cache_key)
+                return png
+        
+        png = self._render_and_release(self._build_individual_chart(lesion_data, lesion_name, treatments), dpi)
+        with self._chart_png_cache_lock:
+            self._chart_png_cache[cache_key] = png
+            if len(self._chart_png_cache) > _PNG_CACHE_SIZE:
+                self._chart_png_cache.popitem(last=False)
+        return png
+    
+    def create_combined_chart_png(self, detailed_data: pd.DataFrame, selected_lesions: List[str],
+                                  treatments: Optional[List[Dict]] = None,
+                                  dpi: Optional[int] = None) -> bytes:
+        """Combined chart as PNG bytes at ``display_dpi``, for static display"""
+        fig = self.create_combined_chart(detailed_data, selected_lesions, treatments)
+        return self._render_and_release(fig, dpi or self.display_dpi)
+    
+    def _render_and_release(self, fig: Figure, dpi: int) -> bytes:
+        """Encode a figure this generator owns, then put it back in the pool"""
+        png = self.to_png_bytes(fig, dpi)
+        self.release_chart(fig)
+        return png
+    
+    def generate_all(self, lesion_frames: Dict[str, pd.DataFrame],
+                     treatments: Optional[List[Dict]] = None, dpi: Optional[int] = None,
+                     workers: Optional[int] = None) -> Dict[str, bytes]:
+        """Render individual charts for many lesions to PNG bytes using all CPU cores
+        
+        Each worker builds its own Agg figure, so only the lesion frames, the
+        treatment periods and the PNG bytes cross the process boundary.
+        """
+        lesion_frames = {name: data for name, data in lesion_frames.items() if not data.empty}
+        if not lesion_frames:
+            return {}
+        
+        dpi = dpi or self.export_dpi
+        jobs = [(name, data, treatments, dpi) for name, data in lesion_frames.items()]
+        
+        # Larger chunks amortize IPC while still keeping every worker busy
+        n_workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(jobs) // (n_workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(lesion_frames, executor.map(_render_individual_png, jobs, chunksize=chunksize)))
+    
+    def _build_individual_chart(self, lesion_data: pd.DataFrame, lesion_name: str,
+                                treatments: Optional[List[Dict]] = None):
+        """Render the individual evolution chart"""
         # Sort data by date
         lesion_data = lesion_data.sort_values('data_exame')
         
         # Create figure and axis
-        fig, ax = plt.subplots(figsize=(12, 8))
+        fig, ax = self._acquire_fig(self.individual_figsize)
         
-        # Convert dates for plotting
-        dates = pd.to_datetime(lesion_data['data_exame'])
-        sizes = lesion_data['tamanho_cm']
+        # Convert dates once to Matplotlib's float days and plot those
+        dates = mdates.date2num(lesion_data['data_exame'].to_numpy())
+        sizes = lesion_data['tamanho_cm'].to_numpy(dtype=np.float64)
         
         # Add treatment periods as background
-        self._add_treatment_periods(ax)
+        self._add_treatment_periods(ax, treatments)
         
         # Plot main line and points
         ax.plot(dates, sizes, marker='o', linewidth=2.5, markersize=8, 
                 color=self.color_palette[0], label=lesion_name, zorder=5)
         
-        # Add data point labels
-        for i, (date, size) in enumerate(zip(dates, sizes)):
-            ax.annotate(f'{size:.2f} cm', 
-                       (date, size), 
+        # Highlight significant changes
+        significant = self._highlight_significant_changes(ax, dates, sizes)
+        
+        # Label only first/last/extreme points, plus significant changes on short series
+        label_idx = {0, len(sizes) - 1, int(np.nanargmax(sizes)), int(np.nanargmin(sizes))}
+        if len(sizes) <= _MAX_LABELED_POINTS:
+            label_idx.update(np.flatnonzero(significant).tolist())
+        
+        # Boxed labels only on short series; each box is an extra patch to render
+        label_box = None
+        if len(sizes) <= _MAX_BOXED_LABEL_POINTS:
+            label_box = dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8)
+        
+        for i in sorted(label_idx):
+            ax.annotate(f'{sizes[i]:.2f} cm', 
+                       (dates[i], sizes[i]), 
                        textcoords="offset points", 
                        xytext=(0, 15), 
                        ha='center',
                        fontsize=9,
-                       bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8),
+                       bbox=label_box,
                        zorder=6)
         
-        # Highlight significant changes
-        self._highlight_significant_changes(ax, dates, sizes)
-        
         # Formatting
         ax.set_title(f'Evolução da {lesion_name}', fontsize=16, fontweight='bold', pad=20)
         ax.set_xlabel('Data do Exame', fontsize=12)
         ax.set_ylabel('Tamanho (cm)', fontsize=12)
         
         # Format x-axis dates
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m/%Y'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-        plt.xticks(rotation=45)
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(_DATE_FORMATTER)
+        ax.xaxis.set_major_locator(_month_locator(dates))
+        ax.tick_params(axis='x', labelrotation=45)
         
         # Grid and styling
         ax.grid(True, alpha=0.3, linestyle='--')
@@ -89,49 +394,31 @@ class VisualizationGenerator:
         # Add statistics box
         self._add_statistics_box(ax, lesion_data, lesion_name)
         
-        plt.tight_layout()
+        fig.tight_layout()
         return fig
     
-    def _add_treatment_periods(self, ax):
+    def _add_treatment_periods(self, ax, treatments: Optional[List[Dict]]):
         """Add treatment periods as colored background regions"""
-        import streamlit as st
-        
-        # Check if treatment periods are available in session state
-        if not st.session_state.get('treatment_periods'):
+        # Check if treatment periods are available
+        if not treatments:
             return
         
         # Get y-axis limits for background shading
         y_min, y_max = ax.get_ylim()
         
-        # Treatment type colors
-        treatment_colors = {
-            'Quimioterapia': '#ffcccc',
-            'Radioterapia': '#ccffcc', 
-            'Imunoterapia': '#ccccff',
-            'Terapia Direcionada': '#ffffcc',
-            'Hormonioterapia': '#ffccff',
-            'Cirurgia': '#ccffff',
-            'Outro': '#f0f0f0'
-        }
-        
-        for i, treatment in enumerate(st.session_state.treatment_periods):
+        # Open-ended treatments are drawn up to now, taken once for all of them
+        now = pd.Timestamp.now()
+        
+        for start_date, end_date, color, label_text in _compiled_treatment_periods(_treatment_snapshot(treatments)):
             try:
-                start_date = pd.to_datetime(treatment['data_inicio'])
-                end_date = pd.to_datetime(treatment['data_fim']) if treatment['data_fim'] else pd.Timestamp.now()
-                
-                # Get color for treatment type
-                color = treatment_colors.get(treatment['tipo'], treatment_colors['Outro'])
+                if end_date is None:
+                    end_date = now
                 
                 # Add background span
                 ax.axvspan(start_date, end_date, alpha=0.3, color=color, zorder=1)
                 
-                # Add treatment label
-                mid_date = start_date + (end_date - start_date) / 2
-                label_text = f"{treatment['tipo']}"
-                if treatment['medicamento']:
-                    label_text = f"{treatment['tipo']}\n({treatment['medicamento']})"
-                
                 # Add text annotation at the top
+                mid_date = start_date + (end_date - start_date) / 2
                 ax.text(mid_date, y_max * 0.95, label_text, 
                        ha='center', va='top', fontsize=8,
                        bbox=dict(boxstyle="round,pad=0.3", facecolor=color, alpha=0.8),
@@ -141,50 +428,61 @@ class VisualizationGenerator:
                 continue
     
     def create_combined_chart(self, detailed_data: pd.DataFrame, 
-                            selected_lesions: List[str]) -> plt.Figure:
+                            selected_lesions: List[str],
+                            treatments: Optional[List[Dict]] = None) -> plt.Figure:
         """Create combined chart showing evolution of multiple lesions"""
         
         if detailed_data.empty:
             return self._create_empty_chart("Sem dados para exibir")
         
         # Filter data for selected lesions
+        detailed_data = _ensure_datetime(detailed_data)
         filtered_data = detailed_data[detailed_data['lesao_id'].isin(selected_lesions)]
         
         if filtered_data.empty:
             return self._create_empty_chart("Nenhuma lesão selecionada tem dados")
         
         # Create figure
-        fig, ax = plt.subplots(figsize=(14, 10))
+        fig, ax = self._acquire_fig(self.combined_figsize)
         
         # Add treatment periods as background first
-        self._add_treatment_periods(ax)
+        self._add_treatment_periods(ax, treatments)
         
-        # Plot each lesion
+        # Gather every lesion's series, then draw lines and markers in batched artists
+        lesion_groups = dict(tuple(filtered_data.groupby('lesao_id', sort=False, observed=True)))
+        segments, segment_colors, legend_handles = [], [], []
         for i, lesion_id in enumerate(selected_lesions):
-            lesion_data = filtered_data[filtered_data['lesao_id'] == lesion_id]
+            lesion_data = lesion_groups.get(lesion_id)
             
-            if not lesion_data.empty:
+            if lesion_data is not None and not lesion_data.empty:
                 lesion_data = lesion_data.sort_values('data_exame')
-                dates = pd.to_datetime(lesion_data['data_exame'])
-                sizes = lesion_data['tamanho_cm']
+                # Plot numeric dates, thinned out for long series
+                dates, sizes = _decimate(
+                    mdates.date2num(lesion_data['data_exame'].to_numpy()),
+                    lesion_data['tamanho_cm'].to_numpy(dtype=np.float64)
+                )
                 
                 color = self.color_palette[i % len(self.color_palette)]
-                
-                ax.plot(dates, sizes, marker='o', linewidth=2.5, markersize=6,
-                       color=color, label=lesion_id, alpha=0.8)
+                segments.append(np.column_stack([dates, sizes]))
+                segment_colors.append(color)
+                legend_handles.append(Line2D([], [], marker='o', linewidth=2.5, markersize=6,
+                                             color=color, label=lesion_id, alpha=0.8))
                 
                 # Add last measurement annotation
-                if len(dates) > 0:
-                    last_date = dates.iloc[-1]
-                    last_size = sizes.iloc[-1]
-                    ax.annotate(f'{last_size:.2f}', 
-                               (last_date, last_size),
-                               textcoords="offset points",
-                               xytext=(10, 0),
-                               ha='left',
-                               fontsize=8,
-                               color=color,
-                               fontweight='bold')
+                ax.annotate(f'{sizes[-1]:.2f}', 
+                           (dates[-1], sizes[-1]),
+                           textcoords="offset points",
+                           xytext=(10, 0),
+                           ha='left',
+                           fontsize=8,
+                           color=color,
+                           fontweight='bold')
+        
+        ax.add_collection(LineCollection(segments, colors=segment_colors, linewidths=2.5, alpha=0.8))
+        points = np.concatenate(segments)
+        point_colors = np.repeat(segment_colors, [len(segment) for segment in segments])
+        ax.scatter(points[:, 0], points[:, 1], s=36, c=point_colors, alpha=0.8, zorder=3)
+        ax.autoscale_view()
         
         # Formatting
         ax.set_title('Evolução Comparativa de Todas as Lesões', 
@@ -193,21 +491,22 @@ class VisualizationGenerator:
         ax.set_ylabel('Tamanho (cm)', fontsize=12)
         
         # Format x-axis dates
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m/%Y'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-        plt.xticks(rotation=45)
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(_DATE_FORMATTER)
+        ax.xaxis.set_major_locator(_month_locator(points[:, 0]))
+        ax.tick_params(axis='x', labelrotation=45)
         
         # Grid and styling
         ax.grid(True, alpha=0.3, linestyle='--')
         ax.set_facecolor('#fafafa')
         
         # Legend
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left')
         
         # Add summary statistics
         self._add_combined_statistics(ax, filtered_data)
         
-        plt.tight_layout()
+        fig.tight_layout()
         return fig
     
     def create_variation_chart(self, summary_data: pd.DataFrame) -> plt.Figure:
@@ -216,28 +515,21 @@ class VisualizationGenerator:
         if summary_data.empty:
             return self._create_empty_chart("Sem dados de variação")
         
-        fig, ax = plt.subplots(figsize=(12, 8))
+        fig, ax = self._acquire_fig(self.variation_figsize)
         
         # Prepare data
         lesions = summary_data['Lesão']
         variations = summary_data['Variação Total (%)']
         
-        # Color bars based on positive/negative variation
-        colors = ['#e74c3c' if v > 0 else '#2ecc71' if v < 0 else '#95a5a6' for v in variations]
+        # Color bars based on positive/negative variation (missing values count as no change)
+        signs = np.sign(np.nan_to_num(variations.to_numpy(dtype=np.float64))).astype(int)
+        colors = _VARIATION_PALETTE[signs + 1]
         
         # Create horizontal bar chart
         bars = ax.barh(lesions, variations, color=colors, alpha=0.7, edgecolor='black', linewidth=0.5)
         
-        # Add value labels on bars
-        for i, (bar, value) in enumerate(zip(bars, variations)):
-            width = bar.get_width()
-            label_x = width + (1 if width >= 0 else -1)
-            ax.text(label_x, bar.get_y() + bar.get_height()/2, 
-                   f'{value:+.1f}%', 
-                   ha='left' if width >= 0 else 'right', 
-                   va='center',
-                   fontweight='bold',
-                   fontsize=10)
+        # Add value labels on bars in one batched call
+        ax.bar_label(bars, fmt='{:+.1f}%', padding=3, fontweight='bold', fontsize=10)
         
         # Add vertical line at 0
         ax.axvline(x=0, color='black', linewidth=1, alpha=0.8)
@@ -251,40 +543,45 @@ class VisualizationGenerator:
         ax.grid(True, alpha=0.3, axis='x')
         ax.set_facecolor('#fafafa')
         
-        plt.tight_layout()
+        fig.tight_layout()
         return fig
     
-    def _highlight_significant_changes(self, ax, dates, sizes):
-        """Highlight points with significant changes"""
+    def _highlight_significant_changes(self, ax, dates, sizes) -> np.ndarray:
+        """Highlight points with significant changes, returning their mask"""
         if len(sizes) < 2:
-            return
+            return np.zeros(len(sizes), dtype=bool)
         
-        # Calculate percentage changes
-        for i in range(1, len(sizes)):
-            prev_size = sizes.iloc[i-1]
-            curr_size = sizes.iloc[i]
-            
-            if prev_size > 0:
-                change_pct = ((curr_size - prev_size) / prev_size) * 100
-                
-                # Highlight significant changes (>20%)
-                if abs(change_pct) > 20:
-                    color = 'red' if change_pct > 0 else 'green'
-                    ax.scatter(dates.iloc[i], curr_size, s=150, 
-                             facecolors='none', edgecolors=color, linewidth=3, alpha=0.8)
+        x = np.asarray(dates)
+        s = np.asarray(sizes, dtype=np.float64)
+        
+        # Percentage change from the previous measurement (0 where it was not positive)
+        change = np.zeros_like(s)
+        np.divide(s[1:] - s[:-1], s[:-1], out=change[1:], where=s[:-1] > 0)
+        
+        # Highlight significant changes (>20%) in a single scatter, red up and green down
+        significant = np.abs(change) > 0.20
+        if significant.any():
+            edge_colors = np.where(change[significant] > 0, 'red', 'green')
+            ax.scatter(x[significant], s[significant], s=150,
+                     facecolors='none', edgecolors=edge_colors, linewidth=3, alpha=0.8)
+        
+        return significant
     
     def _add_trend_line(self, ax, dates, sizes):
-        """Add trend line to the chart"""
+        """Add trend line to the chart (dates already as Matplotlib float days)"""
         try:
-            # Convert dates to numeric for trend calculation
-            date_numeric = mdates.date2num(dates)
-            
-            # Calculate linear trend
-            z = np.polyfit(date_numeric, sizes, 1)
-            p = np.poly1d(z)
+            # Calculate linear trend (memoized on the raw series bytes)
+            x = np.asarray(dates, dtype=np.float64)
+            y = np.asarray(sizes, dtype=np.float64)
+            # A constant history has nothing to fit; skip the flat line
+            if np.nanmax(y) - np.nanmin(y) < 1e-9:
+                return
+            slope, intercept = _trend_coefs(x.tobytes(), y.tobytes())
+            if not np.isfinite(slope):
+                return
             
             # Plot trend line
-            ax.plot(dates, p(date_numeric), "--", alpha=0.6, color='gray', linewidth=2, label='Tendência')
+            ax.plot(x, slope * x + intercept, "--", alpha=0.6, color='gray', linewidth=2, label='Tendência')
             
         except Exception:
             # If trend calculation fails, skip it
@@ -295,11 +592,10 @@ class VisualizationGenerator:
         if lesion_data.empty:
             return
         
-        # Calculate statistics
-        first_size = lesion_data.iloc[0]['tamanho_cm']
-        last_size = lesion_data.iloc[-1]['tamanho_cm']
-        max_size = lesion_data['tamanho_cm'].max()
-        min_size = lesion_data['tamanho_cm'].min()
+        # Calculate statistics on the raw array
+        sizes = lesion_data['tamanho_cm'].to_numpy(dtype=np.float64)
+        first_size, last_size = sizes[0], sizes[-1]
+        max_size, min_size = np.nanmax(sizes), np.nanmin(sizes)
         
         variation_pct = ((last_size - first_size) / first_size) * 100 if first_size > 0 else 0
         
@@ -333,7 +629,7 @@ class VisualizationGenerator:
     
     def _create_empty_chart(self, message: str) -> plt.Figure:
         """Create empty chart with message"""
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig, ax = self._acquire_fig(self.empty_figsize)
         ax.text(0.5, 0.5, message, transform=ax.transAxes, fontsize=14,
                ha='center', va='center', bbox=dict(boxstyle="round,pad=1", 
                facecolor='lightgray', alpha=0.8))
@@ -343,56 +639,96 @@ class VisualizationGenerator:
         ax.set_yticks([])
         return fig
     
-    def save_chart(self, fig: plt.Figure, filename: str, dpi: int = 300) -> str:
-        """Save chart to file"""
+    def save_chart(self, fig: plt.Figure, filename: str, dpi: Optional[int] = None,
+                   format: Optional[str] = None) -> str:
+        """Save chart to file
+        
+        ``format`` defaults to the file extension; 'svg' writes a vector file, which
+        is much cheaper than a high-dpi PNG, with dense artists rasterized at ``dpi``.
+        ``dpi`` defaults to ``export_dpi``. Charts already run tight_layout, so no
+        extra trial render is spent on bbox_inches='tight'.
+        """
+        dpi = dpi or self.export_dpi
         try:
-            fig.savefig(filename, dpi=dpi, bbox_inches='tight', 
-                       facecolor='white', edgecolor='none')
+            chart_format = (format or os.path.splitext(filename)[1].lstrip('.') or 'png').lower()
+            
+            if chart_format != 'png':
+                # Dense lines and markers are embedded as bitmaps; axes and text stay vector
+                for ax in fig.axes:
+                    for artist in ax.lines + ax.collections:
+                        if _artist_points(artist) >= _RASTERIZE_MIN_POINTS:
+                            artist.set_rasterized(True)
+                fig.savefig(filename, format=chart_format, dpi=dpi,
+                           facecolor='white', edgecolor='none')
+                return filename
+            
+            with open(filename, 'wb') as f:
+                f.write(self.to_png_bytes(fig, dpi))
             return filename
         except Exception as e:
             raise Exception(f"Erro ao salvar gráfico: {str(e)}")
     
-    def create_timeline_chart(self, detailed_data: pd.DataFrame):
+    def to_png_bytes(self, fig: plt.Figure, dpi: Optional[int] = None) -> bytes:
+        """Render a chart to PNG bytes in memory, for reports and downloads"""
+        dpi = dpi or self.export_dpi
+        # Re-exporting the same figure at the same dpi reuses the encoded bytes
+        rendered = self._png_cache.setdefault(fig, {})
+        if dpi not in rendered:
+            buffer = io.BytesIO()
+            # Fast zlib level: the bitmap is large and mostly flat colour
+            fig.savefig(buffer, format='png', dpi=dpi,
+                       facecolor='white', edgecolor='none',
+                       pil_kwargs={'compress_level': 1})
+            rendered[dpi] = buffer.getvalue()
+        return rendered[dpi]
+    
+    def create_timeline_chart(self, detailed_data: pd.DataFrame,
+                              treatments: Optional[List[Dict]] = None):
         """Create timeline chart showing all measurements chronologically"""
         
         if detailed_data.empty:
             return self._create_empty_chart("Sem dados para timeline")
         
         # Sort by date
-        detailed_data = detailed_data.sort_values('data_exame')
+        detailed_data = _ensure_datetime(detailed_data).sort_values('data_exame')
         
         # Create figure
-        fig, ax = plt.subplots(figsize=(16, 10))
+        fig, ax = self._acquire_fig(self.timeline_figsize)
         
         # Add treatment periods as background first
-        self._add_treatment_periods(ax)
-        
-        # Get unique lesions
-        unique_lesions = detailed_data['lesao_id'].unique()
+        self._add_treatment_periods(ax, treatments)
         
-        # Create y-positions for each lesion
+        # Lesion rows in order of first appearance; every point is drawn in one scatter
+        positions, unique_lesions = pd.factorize(detailed_data['lesao_id'])
         y_positions = {lesion: i for i, lesion in enumerate(unique_lesions)}
-        
-        # Plot each measurement as a point
-        for lesion in unique_lesions:
-            lesion_data = detailed_data[detailed_data['lesao_id'] == lesion]
-            dates = pd.to_datetime(lesion_data['data_exame'])
-            sizes = lesion_data['tamanho_cm']
-            
-            # Use consistent color
-            color = self.color_palette[y_positions[lesion] % len(self.color_palette)]
-            
-            # Plot points with higher zorder to appear over treatment periods
-            ax.scatter(dates, [y_positions[lesion]] * len(dates), 
-                      s=sizes * 100, alpha=0.8, color=color, label=lesion, zorder=5)
-            
-            # Add size labels
-            for date, size in zip(dates, sizes):
+        dates = mdates.date2num(detailed_data['data_exame'].to_numpy())
+        sizes = detailed_data['tamanho_cm'].to_numpy(dtype=np.float64)
+        
+        # Use consistent color per lesion
+        palette = np.array(self.color_palette)
+        point_colors = palette[positions % len(palette)]
+        
+        # Plot points with higher zorder to appear over treatment periods
+        ax.scatter(dates, positions, s=sizes * 100, alpha=0.8, c=point_colors, zorder=5)
+        
+        # Label a size only when it differs from the lesion's previous reading,
+        # and only while the labels are still readable
+        rounded = np.round(sizes, 1)
+        labeled = pd.Series(rounded).groupby(positions).diff().ne(0).to_numpy()
+        if labeled.sum() <= _MAX_TIMELINE_LABELS:
+            for date, position, size in zip(dates[labeled], positions[labeled], rounded[labeled]):
                 ax.annotate(f'{size:.1f}cm', 
-                           (date, y_positions[lesion]), 
+                           (date, position), 
                            xytext=(5, 0), textcoords='offset points',
                            va='center', fontsize=8, zorder=6)
         
+        # Legend entries built from proxies, one per lesion
+        legend_handles = [
+            Line2D([], [], marker='o', linestyle='', alpha=0.8,
+                   color=palette[i % len(palette)], label=lesion)
+            for i, lesion in enumerate(unique_lesions)
+        ]
+        
         # Formatting
         ax.set_yticks(list(y_positions.values()))
         ax.set_yticklabels(list(y_positions.keys()))
@@ -401,13 +737,14 @@ class VisualizationGenerator:
         ax.set_title('Timeline de Todas as Medições com Períodos de Tratamento', fontsize=16, fontweight='bold')
         
         # Format dates
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m/%Y'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-        plt.xticks(rotation=45)
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(_DATE_FORMATTER)
+        ax.xaxis.set_major_locator(_month_locator(dates))
+        ax.tick_params(axis='x', labelrotation=45)
         
         # Grid
         ax.grid(True, alpha=0.3)
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left')
         
-        plt.tight_layout()
+        fig.tight_layout()
         return fig